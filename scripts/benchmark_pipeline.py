@@ -0,0 +1,62 @@
+import statistics
+import subprocess
+import sys
+import time
+
+from run_pipeline import SCRIPTS, STAGES
+
+
+def timed(command, repeat=1):
+    """Median wall-clock time of a command, in seconds."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(
+            command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def run_serial_scripts():
+    """Every stage of run_pipeline.py in order, one interpreter each, the way
+    the original run_all.sh ran its scripts (it had fewer of them)."""
+    for stage in STAGES.values():
+        subprocess.run(
+            [sys.executable, str(SCRIPTS / stage["script"])],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print("Interpreter startup (median of {} runs)".format(repeat))
+    startup = {
+        "python": "pass",
+        "+ pandas": "import pandas",
+        "+ pandas, matplotlib, seaborn": (
+            "import pandas, matplotlib.pyplot, seaborn, "
+            "mpl_toolkits.axes_grid1.inset_locator"
+        ),
+    }
+    for label, code in startup.items():
+        print(f"  {label:<32} {timed([sys.executable, '-c', code], repeat):6.2f} s")
+
+    print("End-to-end, all {} stages forced".format(len(STAGES)))
+    t0 = time.perf_counter()
+    run_serial_scripts()
+    print(f"  {'serial, one interpreter/stage':<32} {time.perf_counter() - t0:6.2f} s")
+
+    runner = [sys.executable, str(SCRIPTS / "run_pipeline.py"), "--force"]
+    print(f"  {'run_pipeline.py (concurrent)':<32} {timed(runner):6.2f} s")
+    print(
+        f"  {'run_pipeline.py --in-process':<32} "
+        f"{timed(runner + ['--in-process']):6.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
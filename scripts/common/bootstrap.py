@@ -0,0 +1,109 @@
+import numpy as np
+
+# Fixed so that the intervals in the paper tables are reproducible
+BOOTSTRAP_SEED = 20231012
+N_RESAMPLES = 10000
+CONFIDENCE_LEVEL = 0.95
+
+# Statistics resampled for every series, as (name, quantile or None for mean)
+BOOTSTRAP_STATISTICS = [
+    ("Mean", None),
+    ("Median", 0.5),
+    ("25th percentile", 0.25),
+    ("75th percentile", 0.75),
+]
+
+# Upper bound on the number of values in one block of the resample matrix,
+# which keeps memory flat for long series (2**22 float64 values is 32 MB)
+MAX_BLOCK_VALUES = 2**22
+
+
+def bootstrap_rng(size):
+    """A generator seeded by BOOTSTRAP_SEED and the data size."""
+    return np.random.default_rng([BOOTSTRAP_SEED, int(size)])
+
+
+def _at_positions(ordered, positions):
+    """Linear interpolation (np.quantile's) between sorted columns, per row."""
+    low = np.floor(positions).astype(np.intp)
+    high = np.minimum(low + 1, ordered.shape[1] - 1)
+    below = np.take_along_axis(ordered, low[:, None], axis=1)[:, 0]
+    above = np.take_along_axis(ordered, high[:, None], axis=1)[:, 0]
+    return below + (positions - low) * (above - below)
+
+
+def bootstrap_distributions(values, rng, n_resamples=N_RESAMPLES):
+    """Bootstrap distributions of BOOTSTRAP_STATISTICS, with and without outliers.
+
+    The raw values are resampled, and the 1.5 * IQR filter of remove_outliers
+    is applied inside each resample, with that resample's own quartiles, so the
+    intervals of the filtered statistics include the variability of the filter.
+    Returns (raw, filtered), each a dict of name -> distribution.
+
+    Resamples are drawn as an (n_resamples, len(values)) matrix of indices into
+    the sorted values, in row blocks of at most MAX_BLOCK_VALUES. Sorting the
+    small integer indices along each row sorts the resample, so quantiles are
+    read off by position and the kept values of a resample are one contiguous
+    run of its row; there is no Python loop over resamples.
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    values = values[~np.isnan(values)]
+    n = len(values)
+    raw, filtered = (
+        {name: np.full(n_resamples, np.nan) for name, _ in BOOTSTRAP_STATISTICS}
+        for _ in range(2)
+    )
+    if n == 0:
+        return raw, filtered
+
+    index_dtype = np.min_scalar_type(n - 1)
+    block = max(1, MAX_BLOCK_VALUES // n)
+    for start in range(0, n_resamples, block):
+        stop = min(start + block, n_resamples)
+        indices = rng.integers(0, n, size=(stop - start, n), dtype=index_dtype)
+        indices.sort(axis=1)
+        resamples = values[indices]
+        del indices
+        total = resamples.sum(axis=1)
+        full = np.full(stop - start, n - 1, dtype=float)
+        for name, q in BOOTSTRAP_STATISTICS:
+            if q is None:
+                raw[name][start:stop] = total / n
+            else:
+                raw[name][start:stop] = _at_positions(resamples, full * q)
+
+        # Outliers sit at the two ends of each sorted row: count them and sum
+        # only the columns that hold an outlier in some row
+        q25 = raw["25th percentile"][start:stop, None]
+        q75 = raw["75th percentile"][start:stop, None]
+        iqr = q75 - q25
+        n_low = (resamples < q25 - 1.5 * iqr).sum(axis=1)
+        n_high = (resamples > q75 + 1.5 * iqr).sum(axis=1)
+        kept = n - n_low - n_high
+        if n_low.max():
+            ends = resamples[:, : n_low.max()]
+            total -= np.where(np.arange(ends.shape[1]) < n_low[:, None], ends, 0).sum(
+                axis=1
+            )
+        if n_high.max():
+            ends = resamples[:, n - n_high.max() :]
+            total -= np.where(
+                np.arange(ends.shape[1])[::-1] < n_high[:, None], ends, 0
+            ).sum(axis=1)
+        for name, q in BOOTSTRAP_STATISTICS:
+            if q is None:
+                filtered[name][start:stop] = total / kept
+            else:
+                filtered[name][start:stop] = _at_positions(
+                    resamples, n_low + (kept - 1) * q
+                )
+    return raw, filtered
+
+
+def confidence_interval(distribution, level=CONFIDENCE_LEVEL):
+    """Percentile interval (low, high) of a bootstrap distribution."""
+    if np.isnan(distribution).all():
+        return np.nan, np.nan
+    alpha = (1 - level) / 2
+    low, high = np.quantile(distribution, [alpha, 1 - alpha])
+    return low, high
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout changes so that old caches are rebuilt
+CACHE_VERSION = 1
+
+
+def file_fingerprint(path, with_hash=True):
+    """Size, mtime and (optionally) content hash of a source file."""
+    stat = os.stat(path)
+    fingerprint = {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        fingerprint["sha256"] = sha256.hexdigest()
+    return fingerprint
+
+
+def sources_match(recorded, sources):
+    """Check recorded fingerprints against the current source files.
+
+    The size and mtime are compared first; the content hash is only computed
+    when they differ, so touching a file without changing it keeps the cache.
+    The mtime of such a file is updated in recorded, so it is hashed only
+    once. Returns (match, refreshed), refreshed telling whether recorded
+    changed.
+    """
+    if len(recorded) != len(sources):
+        return False, False
+
+    refreshed = False
+    for fingerprint, source in zip(recorded, sources):
+        if fingerprint["path"] != str(source) or not os.path.exists(source):
+            return False, False
+        current = file_fingerprint(source, with_hash=False)
+        if (
+            current["size"] == fingerprint["size"]
+            and current["mtime_ns"] == fingerprint["mtime_ns"]
+        ):
+            continue
+        if file_fingerprint(source)["sha256"] != fingerprint["sha256"]:
+            return False, False
+        fingerprint["mtime_ns"] = current["mtime_ns"]
+        refreshed = True
+    return True, refreshed
+
+
+def refresh_manifest(directory, manifest):
+    """Replace the manifest of a cache; skipped if the cache was swapped out."""
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix="manifest.", suffix=".tmp", dir=directory
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, Path(directory) / "manifest.json")
+    except FileNotFoundError:
+        pass
+
+
+def write_cache(cache_directory, df, sources):
+    """Write a DataFrame as one .npy file per column plus a JSON manifest.
+
+    datetime64, timedelta64, numeric and bool columns are stored as they are.
+    String, object and categorical columns are stored as integer codes, with
+    the categories kept in the manifest.
+    """
+    cache_directory = Path(cache_directory)
+    parent = cache_directory.parent
+    parent.mkdir(parents=True, exist_ok=True)
+    # Each writer builds in its own directory, so stages rebuilding the same
+    # cache at once do not write into each other's files
+    tmp_directory = Path(
+        tempfile.mkdtemp(prefix=cache_directory.name + ".", suffix=".tmp", dir=parent)
+    )
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        entry = {"name": column, "file": f"{i}.npy"}
+        if series.dtype.kind not in "biufmM":
+            categorical = series.astype("category")
+            entry["categories"] = categorical.cat.categories.tolist()
+            values = categorical.cat.codes.to_numpy()
+        else:
+            values = series.to_numpy()
+        np.save(tmp_directory / entry["file"], values, allow_pickle=False)
+        columns.append(entry)
+
+    manifest = {
+        "version": CACHE_VERSION,
+        "sources": [file_fingerprint(source) for source in sources],
+        "columns": columns,
+    }
+    with open(tmp_directory / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    # Move the old cache aside and swap the new one in. If another writer
+    # got its cache in place first, that one is kept and this one dropped
+    old_directory = Path(
+        tempfile.mkdtemp(prefix=cache_directory.name + ".", suffix=".old", dir=parent)
+    )
+    try:
+        os.replace(cache_directory, old_directory)
+    except FileNotFoundError:
+        pass
+    try:
+        os.replace(tmp_directory, cache_directory)
+    except OSError:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+    shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def read_cache(cache_directory, sources, mmap=True):
+    """Return the cached DataFrame, or None if it is missing or stale."""
+    manifest_path = Path(cache_directory) / "manifest.json"
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("version") != CACHE_VERSION:
+        return None
+    match, refreshed = sources_match(manifest["sources"], sources)
+    if not match:
+        return None
+    if refreshed:
+        refresh_manifest(cache_directory, manifest)
+
+    data = {}
+    for entry in manifest["columns"]:
+        try:
+            values = np.load(
+                Path(cache_directory) / entry["file"],
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+        except FileNotFoundError:
+            # Another stage swapped a new cache in while this one was read
+            return None
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, entry["categories"])
+        data[entry["name"]] = values
+    return pd.DataFrame(data, copy=False)
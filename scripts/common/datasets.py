@@ -0,0 +1,144 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from common.cache import read_cache, write_cache
+from common.rollup import update_rollup
+
+DATA_DIRECTORY = Path("/streaming_analysis/data")
+CACHE_DIRECTORY = DATA_DIRECTORY / "cache"
+
+MERGED_JOB_INFO_PATH = DATA_DIRECTORY / "file_transfer" / "merged_job_info.csv"
+SAVE_TIMES_PATH = DATA_DIRECTORY / "file_transfer" / "save_times.json"
+SAVE_TIME_STATS_PATH = DATA_DIRECTORY / "file_transfer" / "save_time_stats.csv"
+QUEUE_TIME_ROLLUP_PATH = CACHE_DIRECTORY / "rollups" / "queue_time.json"
+
+STREAMING_SIZES = ["128", "256", "512", "1024"]
+
+# Columns parsed once and stored with their numpy dtype in the cache
+MERGED_JOB_INFO_SCHEMA = {
+    "datetime": ["Submit", "Start", "End"],
+    "timedelta": ["Elapsed", "elapsed"],
+}
+STREAMING_TIMES_SCHEMA = {
+    "datetime": ["nersc_write_time", "ncem_created_time"],
+    "timedelta": [],
+}
+
+# Datasets already loaded in this interpreter, keyed by name. Each entry holds
+# the source CSV's (size, mtime_ns) so a rewritten CSV is picked up.
+_registry = {}
+
+
+def streaming_times_path(size):
+    return DATA_DIRECTORY / "streaming" / f"streaming_times_{size}.csv"
+
+
+def apply_schema(df, schema):
+    """Convert the text columns of a dataset to their parsed dtypes."""
+    df = df.copy()
+    for column in schema["datetime"]:
+        df[column] = pd.to_datetime(df[column], format="ISO8601")
+    for column in schema["timedelta"]:
+        df[column] = pd.to_timedelta(df[column])
+    return df
+
+
+def _source_stamp(source):
+    stat = os.stat(source)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _register(name, df, source):
+    _registry[name] = (_source_stamp(source), df)
+
+
+def load_dataset(name, source, schema):
+    """Load a dataset from its binary cache, rebuilding it from CSV if stale.
+
+    A dataset loaded earlier in the same interpreter is reused. Callers get a
+    shallow copy, so columns they add are not seen by other stages.
+    """
+    stamp, df = _registry.get(name, (None, None))
+    if df is None or stamp != _source_stamp(source):
+        cache_directory = CACHE_DIRECTORY / name
+        df = read_cache(cache_directory, [source])
+        if df is None:
+            df = apply_schema(pd.read_csv(source), schema)
+            write_cache(cache_directory, df, [source])
+        _register(name, df, source)
+    return df.copy(deep=False)
+
+
+def cache_dataset(name, df, source, schema):
+    """Write the cache for a dataset whose CSV was just written to source."""
+    df = apply_schema(df, schema)
+    write_cache(CACHE_DIRECTORY / name, df, [source])
+    _register(name, df, source)
+
+
+def cache_merged_job_info(df):
+    cache_dataset("merged_job_info", df, MERGED_JOB_INFO_PATH, MERGED_JOB_INFO_SCHEMA)
+
+
+def cache_streaming_times(size, df):
+    cache_dataset(
+        f"streaming_times_{size}",
+        df,
+        streaming_times_path(size),
+        STREAMING_TIMES_SCHEMA,
+    )
+
+
+def load_merged_job_info():
+    return load_dataset("merged_job_info", MERGED_JOB_INFO_PATH, MERGED_JOB_INFO_SCHEMA)
+
+
+def load_streaming_times(size):
+    return load_dataset(
+        f"streaming_times_{size}", streaming_times_path(size), STREAMING_TIMES_SCHEMA
+    )
+
+
+def load_streaming_dfs():
+    return {size: load_streaming_times(size) for size in STREAMING_SIZES}
+
+
+def load_mean_save_times():
+    """Mean save time by size (index) and scan type (Real, Blank columns)."""
+    write_time_df = pd.read_csv(SAVE_TIME_STATS_PATH)
+    # Get the mean times for everything
+    mean_df = write_time_df[write_time_df["Stat"] == "mean"]
+
+    # Get the save times
+    return mean_df.pivot(index="Size", columns="Type", values="save_time")
+
+
+def load_save_overhead():
+    """{size: mean save time of a real scan minus that of a blank scan}."""
+    pivot_df = load_mean_save_times()
+
+    # subtract blank time
+    pivot_df["overhead"] = pivot_df["Real"] - pivot_df["Blank"]
+
+    # just get the overheads in a dictionary.
+    return pivot_df["overhead"].to_dict()
+
+
+def load_queue_time_rollup():
+    """(cells, digests) of the queue time cube by submit hour, QOS and size.
+
+    The cube is first brought up to date with merged_job_info, so it is built
+    on the first call and only new jobs are merged in afterwards.
+    """
+    df = load_merged_job_info()
+    queue_time = (df["Start"] - df["Submit"]).dt.total_seconds()
+    return update_rollup(
+        QUEUE_TIME_ROLLUP_PATH,
+        df["Job ID"],
+        df["Submit"],
+        queue_time,
+        df["QOS"],
+        df["size"],
+    )
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Inclusive scan number ranges of each experiment, by data size. Streaming runs
+# were acquired on 2023.10.13; the offload runs are 30 scans per size.
+STREAMING_EXPERIMENTS = {
+    "128": (2709, 3688),
+    "256": (3813, 4226),
+    "512": (4227, 4644),
+    "1024": (4653, 4698),
+}
+OFFLOAD_EXPERIMENTS = {
+    "128": (4858, 4887),
+    "256": (4828, 4857),
+    "512": (4798, 4827),
+    "1024": (4768, 4797),
+}
+
+# Seconds between scans in the streaming experiments, by data size
+ACQUISITION_INTERVALS = {
+    "128": 5,
+    "256": 15,
+    "512": 55,
+    "1024": 140,
+}
+
+# Scans of the save time measurements (scripts/overhead), by data size: four
+# regions of one sample, then a blank
+OVERHEAD_SCANS = {
+    "128": ["00014", "00018", "00022", "00026", "00093"],
+    "256": ["00015", "00019", "00023", "00027", "00094"],
+    "512": ["00016", "00020", "00024", "00028", "00095"],
+    "1024": ["00017", "00021", "00025", "00029", "00096"],
+}
+OVERHEAD_BLANK_SCANS = ["00093", "00094", "00095", "00096"]
+
+
+def calculate_scan_gb(scan_x, scan_y, frame_x=576, frame_y=576, bit_per_pixel=16):
+    """Gigabytes of a scan_x x scan_y scan of frame_x x frame_y detector frames."""
+    total_pixels = scan_x * scan_y * frame_x * frame_y
+    byte_per_pixel = bit_per_pixel / 8
+    bytes_per_dataset = total_pixels * byte_per_pixel
+    gigabytes_per_dataset = bytes_per_dataset * 1e-9
+    return gigabytes_per_dataset
+
+
+def calculate_data_gb(size):
+    _size = int(size)
+    return calculate_scan_gb(_size, _size)
+
+
+def scan_times_filename(experiment):
+    begin, end = STREAMING_EXPERIMENTS[experiment]
+    return f"scan_times_{begin}_{end}.csv"
+
+
+class ExperimentIndex:
+    """Sorted, non-overlapping scan ranges for labelling scans by experiment.
+
+    Every scan is matched with one np.searchsorted over the range starts, so
+    the cost does not grow with the number of experiments.
+    """
+
+    def __init__(self, experiments):
+        self.labels = list(experiments)
+        ranges = np.array([experiments[label] for label in self.labels])
+        order = np.argsort(ranges[:, 0], kind="stable")
+        self.starts = ranges[order, 0]
+        self.ends = ranges[order, 1]
+        self.sorted_labels = np.array(self.labels, dtype=object)[order]
+        if np.any(self.starts[1:] <= self.ends[:-1]):
+            raise ValueError("Experiment scan ranges overlap")
+
+    def assign(self, scan_numbers):
+        """Categorical of experiment labels (NaN outside every range).
+
+        The categories keep the order the experiments were given in.
+        """
+        scan_numbers = np.asarray(scan_numbers)
+        i = np.searchsorted(self.starts, scan_numbers, side="right") - 1
+        inside = (i >= 0) & (scan_numbers <= self.ends[np.maximum(i, 0)])
+        codes = np.full(len(scan_numbers), -1)
+        positions = {label: n for n, label in enumerate(self.labels)}
+        label_codes = np.array([positions[label] for label in self.sorted_labels])
+        codes[inside] = label_codes[i[inside]]
+        return pd.Categorical.from_codes(codes, categories=self.labels)
@@ -0,0 +1,78 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Bin tables already computed in this interpreter, keyed by a digest of the
+# values and the binning
+_tables = {}
+
+
+def histogram(values, num_bins, bin_range):
+    """Bin counts and probabilities for values, computed once per binning.
+
+    Probabilities are normalized by the number of values inside bin_range, the
+    same as seaborn's stat="probability" with binrange.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    digest = hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+    key = (digest, num_bins, tuple(bin_range))
+
+    if key not in _tables:
+        counts, edges = np.histogram(values, bins=num_bins, range=bin_range)
+        total = counts.sum()
+        _tables[key] = pd.DataFrame(
+            {
+                "bin_left": edges[:-1],
+                "bin_right": edges[1:],
+                "count": counts,
+                "probability": counts / total if total else np.zeros(num_bins),
+            }
+        )
+    return _tables[key]
+
+
+def draw_histogram(ax, table, color, edgecolor="black", alpha=0.75):
+    """Draw a precomputed bin table as bars, styled like sns.histplot."""
+    from matplotlib.colors import to_rgba
+
+    edges = table["bin_left"].to_numpy()
+    widths = (table["bin_right"] - table["bin_left"]).to_numpy()
+    bars = ax.bar(
+        edges,
+        table["probability"].to_numpy(),
+        widths,
+        align="edge",
+        facecolor=to_rgba(color, alpha),
+        edgecolor=edgecolor,
+    )
+
+    for bar in bars:
+        bar.sticky_edges.y[:] = (0, np.inf)
+
+    # Scale the edge width with the on-screen bin width, as seaborn does
+    ax.autoscale_view()
+    binwidth_points = (
+        72
+        / ax.figure.dpi
+        * abs(
+            ax.transData.transform([edges[0] + widths[0]] * 2)
+            - ax.transData.transform([edges[0]] * 2)
+        )[0]
+    )
+    linewidth = min(0.1 * binwidth_points, bars[0].get_linewidth())
+    for bar in bars:
+        bar.set_linewidth(linewidth)
+    return ax
+
+
+def export_histograms(tables, path):
+    """Write {(size, series): table} to a single CSV."""
+    frames = []
+    for (size, series), table in tables.items():
+        frame = table.copy()
+        frame.insert(0, "series", series)
+        frame.insert(0, "size", size)
+        frames.append(frame)
+    pd.concat(frames, ignore_index=True).to_csv(path, index=False)
@@ -0,0 +1,60 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FILE_TRANSFER_DIRECTORY = Path("/streaming_analysis/data/file_transfer")
+OFFLOAD_MEANS_PATH = FILE_TRANSFER_DIRECTORY / "ncem_offload_times.csv"
+OFFLOAD_PER_SCAN_PATH = FILE_TRANSFER_DIRECTORY / "ncem_offload_times_per_scan.csv"
+
+# Fixed so that resampled offload times are the same in every compare stage
+OFFLOAD_SEED = 20231016
+
+# How the NCEM offload time is added to the NERSC job times (OFFLOAD_MODEL):
+#   mean      add the mean offload time of the size (as in the paper)
+#   resample  add one offload time drawn from the measured scans to each job
+#   convolve  pair every job with every measured offload time, which gives the
+#             exact convolution of the two distributions
+OFFLOAD_MODELS = ["mean", "resample", "convolve"]
+
+
+def offload_model():
+    model = os.environ.get("OFFLOAD_MODEL", "mean") or "mean"
+    if model not in OFFLOAD_MODELS:
+        raise ValueError(
+            f"OFFLOAD_MODEL must be one of {', '.join(OFFLOAD_MODELS)}, not {model}"
+        )
+    return model
+
+
+class OffloadTimes:
+    """Adds the offload time of a size to job times, following OFFLOAD_MODEL."""
+
+    def __init__(self, model=None):
+        self.model = model or offload_model()
+        means_df = pd.read_csv(OFFLOAD_MEANS_PATH)
+        self.means = dict(zip(means_df["size"], means_df["offload_time"]))
+        self.samples = {}
+        if self.model != "mean":
+            per_scan_df = pd.read_csv(OFFLOAD_PER_SCAN_PATH)
+            for size, group in per_scan_df.groupby("size"):
+                self.samples[size] = group["offload_time"].to_numpy()
+
+    def add(self, values, size, per_job=False):
+        """values shifted by the offload time of size.
+
+        With the convolve model the result has one value per (job, scan) pair
+        and is only meant for histograms; per_job=True draws one offload time
+        per job instead, for statistics that need one value per job. Sizes
+        without offload measurements are not shifted.
+        """
+        size = int(size)
+        if self.model == "mean" or size not in self.samples:
+            return values + self.means.get(size, 0)
+
+        samples = self.samples[size]
+        if self.model == "convolve" and not per_job:
+            return (np.asarray(values)[:, None] + samples[None, :]).ravel()
+        rng = np.random.default_rng([OFFLOAD_SEED, size])
+        return values + rng.choice(samples, size=len(values))
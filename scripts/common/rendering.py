@@ -0,0 +1,33 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Resolution of saved figures in preview mode (PLOT_PREVIEW=1)
+PREVIEW_DPI = 100
+
+
+def preview_mode():
+    return os.environ.get("PLOT_PREVIEW", "0") not in ("", "0")
+
+
+def figure_dpi(dpi=600):
+    """The dpi to save figures at: dpi, or PREVIEW_DPI in preview mode."""
+    return PREVIEW_DPI if preview_mode() else dpi
+
+
+def render_figures(figures):
+    """Render independent figures in a pool of worker processes.
+
+    figures is a list of (function, args) pairs. The functions must be defined
+    at module level and should receive precomputed arrays or bin tables rather
+    than whole DataFrames, since the arguments are pickled to the workers.
+    PLOT_WORKERS sets the number of processes (default: one per core), and
+    PLOT_WORKERS=1 renders in this process.
+    """
+    workers = int(os.environ.get("PLOT_WORKERS", os.cpu_count() or 1))
+    workers = min(workers, len(figures))
+    if workers <= 1:
+        return [function(*args) for function, args in figures]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, *args) for function, args in figures]
+        return [future.result() for future in futures]
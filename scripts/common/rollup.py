@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.sketches import SUMMARY_QUANTILES, TDigest
+
+# Bump when the stored cube layout changes so that old cubes are rebuilt
+ROLLUP_VERSION = 2
+
+# Dimensions of a cell; coarser views are merged from these
+CELL_DIMENSIONS = ["hour", "qos", "size"]
+MOMENT_COLUMNS = ["count", "sum", "sum_sq", "min", "max"]
+
+
+def cell_names(cells):
+    """Digest key of each cell: YYYY-MM-DDTHH/qos/size."""
+    return [
+        f"{hour:%Y-%m-%dT%H}/{qos}/{size}"
+        for hour, qos, size in cells[CELL_DIMENSIONS].itertuples(index=False)
+    ]
+
+
+def rows_hash(rows):
+    """Hash of the rows of a cube's source, in key order."""
+    rows = rows.sort_values("key")
+    sha256 = hashlib.sha256()
+    for column in ["key", "hour", "size", "value"]:
+        sha256.update(np.ascontiguousarray(rows[column].to_numpy()).tobytes())
+    sha256.update("\n".join(rows["qos"].astype(str)).encode())
+    return sha256.hexdigest()
+
+
+def empty_rollup():
+    cells = pd.DataFrame(
+        {
+            "hour": pd.Series(dtype="datetime64[ns]"),
+            "qos": pd.Series(dtype=object),
+            "size": pd.Series(dtype=int),
+            **{column: pd.Series(dtype=float) for column in MOMENT_COLUMNS},
+        }
+    )
+    return cells, {}, [], None
+
+
+def load_rollup(path):
+    """Read a cube: (cells DataFrame, {cell: TDigest}, row keys, rows hash).
+
+    A missing or outdated cube reads as an empty one.
+    """
+    path = Path(path)
+    if not path.exists():
+        return empty_rollup()
+    with open(path, "r") as f:
+        stored = json.load(f)
+    if stored.get("version") != ROLLUP_VERSION:
+        return empty_rollup()
+
+    cells = pd.DataFrame(stored["cells"], columns=CELL_DIMENSIONS + MOMENT_COLUMNS)
+    cells["hour"] = pd.to_datetime(cells["hour"])
+    digests = {
+        name: TDigest.from_dict(digest) for name, digest in stored["digests"].items()
+    }
+    return cells, digests, stored["keys"], stored["rows"]
+
+
+def save_rollup(path, cells, digests, keys, rows):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    records = cells.assign(hour=cells["hour"].dt.strftime("%Y-%m-%dT%H:00:00"))
+    stored = {
+        "version": ROLLUP_VERSION,
+        "keys": keys,
+        "rows": rows,
+        "cells": records.to_dict(orient="records"),
+        "digests": {name: digests[name].to_dict() for name in sorted(digests)},
+    }
+    # Several stages may bring the cube up to date at once; each writes its
+    # own file and the last one in place wins
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=path.name + ".", suffix=".tmp", dir=path.parent
+    )
+    with os.fdopen(fd, "w") as f:
+        json.dump(stored, f)
+    os.replace(tmp_path, path)
+
+
+def aggregate_cells(rows):
+    """Moments of the values of each cell, and the grouped values."""
+    rows = rows.assign(value_sq=rows["value"] ** 2)
+    grouped = rows.groupby(CELL_DIMENSIONS, sort=True)
+    cells = grouped.agg(
+        count=("value", "size"),
+        sum=("value", "sum"),
+        sum_sq=("value_sq", "sum"),
+        min=("value", "min"),
+        max=("value", "max"),
+    ).reset_index()
+    return cells, grouped["value"]
+
+
+def merge_cells(stored, added):
+    """Cells of stored and added, with the moments of shared cells combined."""
+    if len(stored) == 0:
+        return added
+    combined = pd.concat([stored, added], ignore_index=True)
+    combined["size"] = combined["size"].astype(int)
+    return (
+        combined.groupby(CELL_DIMENSIONS, sort=True)
+        .agg(
+            count=("count", "sum"),
+            sum=("sum", "sum"),
+            sum_sq=("sum_sq", "sum"),
+            min=("min", "min"),
+            max=("max", "max"),
+        )
+        .reset_index()
+    )
+
+
+def update_rollup(path, keys, timestamps, values, qos, size):
+    """Bring the hourly cells of the cube at path up to date with the given rows.
+
+    A cell holds the count, sum, sum of squares, min, max and a t-digest of the
+    values submitted in one hour for one QOS and size. Rows are identified by
+    keys (unique, e.g. the job ID). When every stored row is still there
+    unchanged, only the rows with new keys are aggregated and merged into
+    their cells; otherwise (rows removed or changed) the cube is rebuilt.
+    Returns (cells, digests).
+    """
+    rows = pd.DataFrame(
+        {
+            "key": np.asarray(keys),
+            "hour": pd.DatetimeIndex(timestamps).floor("h"),
+            "qos": np.asarray(qos),
+            "size": np.asarray(size).astype(int),
+            "value": np.asarray(values, dtype=float),
+        }
+    ).dropna(subset=["value"])
+
+    stored_cells, digests, stored_keys, stored_rows = load_rollup(path)
+    known = rows["key"].isin(stored_keys)
+    if known.sum() == len(stored_keys) and rows_hash(rows[known]) == stored_rows:
+        added = rows[~known]
+        if len(added) == 0:
+            return stored_cells, digests
+    else:
+        stored_cells, digests = empty_rollup()[:2]
+        added = rows
+
+    added_cells, grouped = aggregate_cells(added)
+    for name, (_, cell_values) in zip(cell_names(added_cells), grouped):
+        digests.setdefault(name, TDigest()).update(cell_values.to_numpy())
+    cells = merge_cells(stored_cells, added_cells)
+
+    save_rollup(path, cells, digests, rows["key"].tolist(), rows_hash(rows))
+    return cells, digests
+
+
+def query_rollup(cells, digests, by, quantiles=SUMMARY_QUANTILES):
+    """Merge cells into one row per group of by.
+
+    by may hold "hour", "day", "month", "qos" and "size". Each row has the
+    count, mean, std (ddof=1), min and max from the summed moments, and the
+    given quantiles from the merged digests (none if quantiles is empty).
+    """
+    cells = cells.copy()
+    cells["day"] = cells["hour"].dt.date
+    cells["month"] = cells["hour"].dt.to_period("M")
+
+    grouped = cells.groupby(by, sort=True)
+    rolled = grouped.agg(
+        count=("count", "sum"),
+        sum=("sum", "sum"),
+        sum_sq=("sum_sq", "sum"),
+        min=("min", "min"),
+        max=("max", "max"),
+    )
+    count = rolled["count"]
+    rolled["mean"] = rolled["sum"] / count
+    variance = (rolled["sum_sq"] - rolled["sum"] ** 2 / count) / (count - 1)
+    rolled["std"] = np.sqrt(variance.clip(lower=0).where(count > 1))
+    result = rolled[["count", "mean", "std", "min", "max"]].reset_index()
+
+    if len(quantiles):
+        # Group numbers follow the sorted order of the rows above
+        merged = [TDigest() for _ in range(len(result))]
+        for group, name in zip(grouped.ngroup(), cell_names(cells)):
+            merged[group].merge(digests[name])
+        estimates = np.array([digest.quantile(quantiles) for digest in merged])
+        estimates = estimates.reshape(len(result), len(quantiles))
+        for i, q in enumerate(quantiles):
+            result[f"p{int(q * 100)}"] = estimates[:, i]
+    return result
@@ -0,0 +1,306 @@
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Bump when the stored sketch layout changes so that old stores are rebuilt
+SKETCH_VERSION = 1
+
+# Quantiles reported in the per-month summaries
+SUMMARY_QUANTILES = [0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def describe(values):
+    """Exact count, mean, std, min, max and quartiles of values in one sort.
+
+    Matches pandas' mean/std (ddof=1)/median/quantile on the same values, so the
+    quartiles can be reused for the IQR filter instead of calling quantile again.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    ordered = np.sort(values)
+    n = len(ordered)
+    if n == 0:
+        q25 = median = q75 = np.nan
+    else:
+        q25, median, q75 = np.quantile(ordered, [0.25, 0.5, 0.75])
+    return {
+        "count": n,
+        "mean": values.mean() if n else np.nan,
+        "median": median,
+        "std": values.std(ddof=1) if n > 1 else np.nan,
+        "min": ordered[0] if n else np.nan,
+        "max": ordered[-1] if n else np.nan,
+        "q25": q25,
+        "q75": q75,
+    }
+
+
+def iqr_mask(values, q25, q75):
+    """True for the values inside the 1.5 * IQR fences."""
+    iqr = q75 - q25
+    return ~((values < (q25 - 1.5 * iqr)) | (values > (q75 + 1.5 * iqr)))
+
+
+class RunningMoments:
+    """Count, mean, variance (Welford), min and max, mergeable across batches."""
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, minimum=math.inf, maximum=-math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def update(self, values):
+        """Add a batch of values."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        batch_mean = values.mean()
+        batch = RunningMoments(
+            len(values),
+            batch_mean,
+            ((values - batch_mean) ** 2).sum(),
+            values.min(),
+            values.max(),
+        )
+        return self.merge(batch)
+
+    def merge(self, other):
+        """Combine with another RunningMoments (Chan et al.'s parallel update)."""
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["count"], d["mean"], d["m2"], d["min"], d["max"])
+
+
+class TDigest:
+    """Mergeable quantile sketch (merging t-digest with the arcsine scale).
+
+    Centroids are (mean, weight) pairs. While the total weight is at most
+    compression every value is its own centroid and quantiles are exact
+    (np.quantile's linear method); beyond that, neighbouring centroids are
+    merged so that each spans at most one unit of the scale function, which
+    keeps the tails fine-grained.
+    """
+
+    def __init__(
+        self,
+        compression=200,
+        means=(),
+        weights=(),
+        minimum=math.inf,
+        maximum=-math.inf,
+    ):
+        self.compression = compression
+        self.means = np.asarray(means, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        # Kept exactly so the extreme quantiles interpolate towards them
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        """Add a batch of values."""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.minimum = min(self.minimum, values.min())
+            self.maximum = max(self.maximum, values.max())
+        return self._absorb(values, np.ones(len(values)))
+
+    def merge(self, other):
+        """Add the centroids of another digest."""
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self._absorb(other.means, other.weights)
+
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        self.means, self.weights = means[order], weights[order]
+        if self.weights.sum() > self.compression:
+            self._compress()
+        return self
+
+    def _compress(self):
+        total = self.weights.sum()
+        # Scale-function value at the centre of each centroid; centroids in the
+        # same unit interval of the scale are merged
+        centres = (np.cumsum(self.weights) - self.weights / 2) / total
+        scale = self.compression / (2 * math.pi) * np.arcsin(2 * centres - 1)
+        groups = np.floor(scale - scale[0]).astype(int)
+        starts = np.flatnonzero(np.r_[True, np.diff(groups) != 0])
+        weights = np.add.reduceat(self.weights, starts)
+        self.means = np.add.reduceat(self.means * self.weights, starts) / weights
+        self.weights = weights
+
+    def quantile(self, q):
+        """Estimated quantile(s), interpolating between centroid centres."""
+        if len(self.weights) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        # Rank of each centroid's centre on the 0..n-1 scale np.quantile uses,
+        # with the exact minimum and maximum at the two ends
+        centres = np.cumsum(self.weights) - (self.weights + 1) / 2
+        ranks = np.r_[0, centres, self.count - 1]
+        values = np.r_[self.minimum, self.means, self.maximum]
+        return np.interp(np.asarray(q) * (self.count - 1), ranks, values)
+
+    def to_dict(self):
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.minimum,
+            "max": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["compression"], d["means"], d["weights"], d["min"], d["max"])
+
+
+class Sketch:
+    """RunningMoments plus a TDigest for one partition of a series."""
+
+    def __init__(self, moments=None, digest=None):
+        self.moments = moments or RunningMoments()
+        self.digest = digest or TDigest()
+
+    def update(self, values):
+        self.moments.update(values)
+        self.digest.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.digest.merge(other.digest)
+        return self
+
+    def summary(self, quantiles=SUMMARY_QUANTILES):
+        summary = {
+            "count": self.moments.count,
+            "mean": self.moments.mean if self.moments.count else np.nan,
+            "std": self.moments.std,
+            "min": self.moments.minimum if self.moments.count else np.nan,
+            "max": self.moments.maximum if self.moments.count else np.nan,
+        }
+        for q, value in zip(quantiles, self.digest.quantile(quantiles)):
+            summary[f"p{int(q * 100)}"] = value
+        return summary
+
+    def to_dict(self):
+        return {"moments": self.moments.to_dict(), "digest": self.digest.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            RunningMoments.from_dict(d["moments"]), TDigest.from_dict(d["digest"])
+        )
+
+
+def load_sketches(path):
+    """Read a sketch store: {partition: {"rows": digest, "sketch": Sketch}}."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        stored = json.load(f)
+    if stored.get("version") != SKETCH_VERSION:
+        return {}
+    return {
+        partition: {"rows": entry["rows"], "sketch": Sketch.from_dict(entry["sketch"])}
+        for partition, entry in stored["partitions"].items()
+    }
+
+
+def save_sketches(path, store):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stored = {
+        "version": SKETCH_VERSION,
+        "partitions": {
+            partition: {"rows": entry["rows"], "sketch": entry["sketch"].to_dict()}
+            for partition, entry in sorted(store.items())
+        },
+    }
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(stored, f)
+    os.replace(tmp_path, path)
+
+
+def update_daily_sketches(path, series, timestamps, values):
+    """Bring the per-day sketches of a series in the store at path up to date.
+
+    Partitions are keyed "<series>/<YYYY-MM-DD>". Only days whose rows changed
+    since the last run are rebuilt; unchanged days are kept as stored, and days
+    of this series that no longer have rows are dropped. Returns the store.
+    """
+    store = load_sketches(path)
+    values = pd.Series(np.asarray(values, dtype=float))
+    days = pd.Series(pd.DatetimeIndex(timestamps).strftime("%Y-%m-%d"))
+
+    current = set()
+    for day, day_values in values.groupby(days, sort=True):
+        partition = f"{series}/{day}"
+        current.add(partition)
+        day_values = day_values.to_numpy()
+        rows = hashlib.blake2b(day_values.tobytes(), digest_size=16).hexdigest()
+        if store.get(partition, {}).get("rows") != rows:
+            store[partition] = {"rows": rows, "sketch": Sketch().update(day_values)}
+
+    for partition in list(store):
+        if partition.startswith(f"{series}/") and partition not in current:
+            del store[partition]
+
+    save_sketches(path, store)
+    return store
+
+
+def monthly_summaries(store):
+    """Merge per-day sketches into one summary row per series and month."""
+    months = {}
+    for partition, entry in sorted(store.items()):
+        series, day = partition.split("/")
+        key = (series, day[:7])
+        months.setdefault(key, Sketch()).merge(entry["sketch"])
+
+    rows = [
+        {"series": series, "month": month, **sketch.summary()}
+        for (series, month), sketch in months.items()
+    ]
+    return pd.DataFrame(rows)
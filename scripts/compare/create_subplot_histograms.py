@@ -1,52 +1,57 @@
+import sys
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import seaborn as sns
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
-filename_map = {
-    "128": "streaming_times_128.csv",
-    "256": "streaming_times_256.csv",
-    "512": "streaming_times_512.csv",
-    "1024": "streaming_times_1024.csv",
-}
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import (
+    load_merged_job_info,
+    load_save_overhead,
+    load_streaming_dfs,
+)
+from common.histograms import draw_histogram, export_histograms, histogram
+from common.offload import OffloadTimes
+from common.rendering import figure_dpi, render_figures
 
 
 def read_and_prepare_data():
     """Read and prepare data for plotting histograms."""
-    df = pd.read_csv("/streaming_analysis/data/file_transfer/merged_job_info.csv")
-    offload_df = pd.read_csv(
-        "/streaming_analysis/data/file_transfer/ncem_offload_times.csv"
-    )
-    offload_dict = dict(zip(offload_df["size"], offload_df["offload_time"]))
+    df = load_merged_job_info()
+    offload_times = OffloadTimes()
 
-    # Make write times
-    write_time_df = pd.read_csv(
-        "/streaming_analysis/data/file_transfer/save_time_stats.csv"
-    )
-    # Get the mean times for everything
-    mean_df = write_time_df[write_time_df["Stat"] == "mean"]
+    save_overhead = load_save_overhead()
 
-    # Get the save times
-    pivot_df = mean_df.pivot(index="Size", columns="Type", values="save_time")
+    streaming_dfs = load_streaming_dfs()
+    return df, offload_times, streaming_dfs, save_overhead
 
-    # subtract blank time
-    pivot_df["overhead"] = pivot_df["Real"] - pivot_df["Blank"]
 
-    # just get the overheads in a dictionary.
-    save_overhead = pivot_df["overhead"].to_dict()
+def prepare_tables(
+    df, streaming_df, size, column, bin_range, num_bins, offload_times, write_time
+):
+    """Bin the series drawn in the subplot for a given size and column."""
+    # Filter DataFrame based on size
+    filtered_df = df[df["size"] == size]
 
-    streaming_dfs = {
-        size: pd.read_csv(f"/streaming_analysis/data/streaming/{filename}")
-        for size, filename in filename_map.items()
-    }
-    return df, offload_dict, streaming_dfs, save_overhead
+    # Shift the histogram to the right by adding the offload time
+    shifted_elapsed_time = (
+        offload_times.add(filtered_df[column].dt.total_seconds(), size) - write_time * 2
+    )
+
+    # Bin each series once; the main plot and the inset share the tables
+    tables = {"file_transfer": histogram(shifted_elapsed_time, num_bins, bin_range)}
+    if streaming_df is not None:
+        tables["streaming"] = histogram(
+            streaming_df["time_difference_seconds"], num_bins, bin_range
+        )
+    return tables
 
 
-def plot_subplot(
-    ax, df, streaming_df, size, column, bin_range, num_bins, offload_time, write_time
-):
-    """Plot a histogram on a given Matplotlib axis."""
+def plot_subplot(ax, tables, bin_range):
+    """Plot a histogram from precomputed bin tables on a given Matplotlib axis."""
     # Define font sizes
     label_font_size = 8
     tick_font_size = 10
@@ -54,39 +59,10 @@ def plot_subplot(
     # Set Seaborn style
     sns.set_style("ticks")
 
-    # Filter DataFrame based on size
-    filtered_df = df[df["size"] == size]
-
-    # Shift the histogram to the right by adding the offload_time
-    shifted_elapsed_time = (
-        pd.to_timedelta(filtered_df[column]).dt.total_seconds()
-        + offload_time
-        - write_time * 2
-    )
-
     # Main plot
-    ax_main = sns.histplot(
-        shifted_elapsed_time,
-        bins=num_bins,
-        binrange=bin_range,
-        kde=False,
-        color="#BB0700",
-        edgecolor="black",
-        stat="probability",
-        ax=ax,
-    )
-
-    if streaming_df is not None:
-        sns.histplot(
-            streaming_df["time_difference_seconds"],
-            bins=num_bins,
-            binrange=bin_range,
-            kde=False,
-            color="#0762CF",
-            edgecolor="black",
-            stat="probability",
-            ax=ax,
-        )
+    draw_histogram(ax, tables["file_transfer"], "#BB0700")
+    if "streaming" in tables:
+        draw_histogram(ax, tables["streaming"], "#0762CF")
 
     ax.set_xlim(-5, bin_range[1])
     ax.set_ylim(0, 0.2)
@@ -98,28 +74,9 @@ def plot_subplot(
 
     # Inset plot
     ax_inset = inset_axes(ax, width="40%", height="40%", borderpad=1)
-    sns.histplot(
-        shifted_elapsed_time,
-        bins=num_bins,
-        binrange=bin_range,
-        kde=False,
-        color="#BB0700",
-        edgecolor="black",
-        stat="probability",
-        ax=ax_inset,
-    )
-
-    if streaming_df is not None:
-        sns.histplot(
-            streaming_df["time_difference_seconds"],
-            bins=num_bins,
-            binrange=bin_range,
-            kde=False,
-            color="#0762CF",
-            edgecolor="black",
-            stat="probability",
-            ax=ax_inset,
-        )
+    draw_histogram(ax_inset, tables["file_transfer"], "#BB0700")
+    if "streaming" in tables:
+        draw_histogram(ax_inset, tables["streaming"], "#0762CF")
 
     ax_inset.set_xlim(-10, 600)
     ax_inset.set_ylim(0, 1)
@@ -139,37 +96,64 @@ def plot_subplot(
     ax_inset.set_xlabel(None)
 
 
-def main():
-    df, offload_dict, streaming_dfs, write_time_df = read_and_prepare_data()
-    bin_range = (0, 600)
-    num_bins = 200
-
+def plot_combined(tables_by_size, bin_range, filename):
+    """Plot the 2x2 figure of histograms from the bin tables of each size."""
     fig, axes = plt.subplots(2, 2, figsize=(10, 8), sharex=True, sharey=True)
     plt.subplots_adjust(hspace=0.3, wspace=0.3)
 
     for ax, size in zip(axes.flatten(), [128, 256, 512, 1024]):
+        plot_subplot(ax, tables_by_size[size], bin_range)
+
+    fig.text(0.5, 0.02, "Transfer and Count Time (s)", ha="center", fontsize=14)
+    fig.text(0.02, 0.5, "Probability", va="center", rotation="vertical", fontsize=14)
+
+    plt.tight_layout(rect=[0.04, 0.04, 1, 1])
+    plt.savefig(filename, dpi=figure_dpi())
+    plt.close()
+
+
+def main():
+    df, offload_times, streaming_dfs, write_time_df = read_and_prepare_data()
+    bin_range = (0, 600)
+    num_bins = 200
+
+    tables_by_size = {}
+    bin_tables = {}
+    for size in [128, 256, 512, 1024]:
         size_str = str(size)
         streaming_df = streaming_dfs.get(size_str, None)
-        offload_time = offload_dict.get(size, 0)
         write_time = write_time_df.get(size)
-        plot_subplot(
-            ax,
+        tables_by_size[size] = prepare_tables(
             df,
             streaming_df,
             size,
             "elapsed",
             bin_range,
             num_bins,
-            offload_time,
+            offload_times,
             write_time,
         )
+        for series, table in tables_by_size[size].items():
+            bin_tables[(size, series)] = table
+
+    render_figures(
+        [
+            (
+                plot_combined,
+                (
+                    tables_by_size,
+                    bin_range,
+                    "/streaming_analysis/plots/transfer_histogram_combined.png",
+                ),
+            )
+        ]
+    )
 
-    fig.text(0.5, 0.02, "Transfer and Count Time (s)", ha="center", fontsize=14)
-    fig.text(0.02, 0.5, "Probability", va="center", rotation="vertical", fontsize=14)
-
-    plt.tight_layout(rect=[0.04, 0.04, 1, 1])
-    plt.savefig("/streaming_analysis/plots/transfer_histogram_combined.png", dpi=600)
-    plt.close()
+    # Export the bin tables so the figure can be redrawn without the raw data
+    export_histograms(
+        bin_tables,
+        "/streaming_analysis/data/outputs/transfer_histogram_combined_bins.csv",
+    )
 
 
 if __name__ == "__main__":
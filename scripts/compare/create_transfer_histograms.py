@@ -1,76 +1,64 @@
+import sys
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import seaborn as sns
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
-plt.rcParams["font.family"] = "Georgia Pro"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-filename_map = {
-    "128": "streaming_times_128.csv",
-    "256": "streaming_times_256.csv",
-    "512": "streaming_times_512.csv",
-    "1024": "streaming_times_1024.csv",
-}
+from common.datasets import load_merged_job_info, load_streaming_dfs
+from common.histograms import draw_histogram, export_histograms, histogram
+from common.offload import OffloadTimes
+from common.rendering import figure_dpi, render_figures
+
+plt.rcParams["font.family"] = "Georgia Pro"
 
 
 def read_and_prepare_data():
     """Read and prepare data for plotting histograms."""
-    df = pd.read_csv("/streaming_analysis/data/file_transfer/merged_job_info.csv")
-    offload_df = pd.read_csv(
-        "/streaming_analysis/data/file_transfer/ncem_offload_times.csv"
-    )
-    offload_dict = dict(zip(offload_df["size"], offload_df["offload_time"]))
-    streaming_dfs = {
-        size: pd.read_csv(f"/streaming_analysis/data/streaming/{filename}")
-        for size, filename in filename_map.items()
+    df = load_merged_job_info()
+    offload_times = OffloadTimes()
+    streaming_dfs = load_streaming_dfs()
+    return df, offload_times, streaming_dfs
+
+
+def prepare_tables(df, streaming_df, size, column, bin_range, num_bins, offload_times):
+    """Bin the series drawn in the histogram for a given size and column."""
+    filtered_df = df[df["size"] == size]
+
+    # Bin each series once; the main plot and the inset share the tables
+    elapsed_time = filtered_df[column].dt.total_seconds()
+    tables = {
+        # Shift the histogram to the right by adding the offload time
+        "file_transfer": histogram(
+            offload_times.add(elapsed_time, size), num_bins, bin_range
+        ),
+        "count": histogram(elapsed_time, num_bins, bin_range),
     }
-    return df, offload_dict, streaming_dfs
+    if streaming_df is not None:
+        tables["streaming"] = histogram(
+            streaming_df["time_difference_seconds"], num_bins, bin_range
+        )
+    return tables
 
 
-def plot_histogram(
-    df, streaming_df, size, column, xlabel, filename, bin_range, num_bins, offload_time
-):
-    """Plot a histogram for a given size and column."""
+def plot_histogram(tables, xlabel, filename, bin_range):
+    """Plot a histogram from the bin tables of one size."""
     # Define font sizes
     label_font_size = 8
     tick_font_size = 6
 
     sns.set_style("ticks")
-    filtered_df = df[df["size"] == size]
-
-    # Get the current figure's aspect ratio
-    fig = plt.gcf()
-    aspect_ratio = fig.get_figheight() / fig.get_figwidth()
 
-    # Set the figure width to 3 inches and adjust the height to maintain the aspect ratio
+    # Set the figure width to 3 inches
     plt.figure(figsize=(3, 2))
 
-    # Shift the histogram to the right by adding the offload_time
-    shifted_elapsed_time = (
-        pd.to_timedelta(filtered_df[column]).dt.total_seconds() + offload_time
-    )
-
     # Main plot
-    ax_main = sns.histplot(
-        shifted_elapsed_time,
-        bins=num_bins,
-        binrange=bin_range,
-        kde=False,
-        color="#BB0700",
-        edgecolor="black",
-        stat="probability",
-    )
-    if streaming_df is not None:
-        sns.histplot(
-            streaming_df["time_difference_seconds"],
-            bins=num_bins,
-            binrange=bin_range,
-            kde=False,
-            color="#0762CF",
-            edgecolor="black",
-            stat="probability",
-        )
+    ax_main = draw_histogram(plt.gca(), tables["file_transfer"], "#BB0700")
+    if "streaming" in tables:
+        draw_histogram(ax_main, tables["streaming"], "#0762CF")
 
     plt.xlabel(xlabel, fontsize=label_font_size)
     plt.xlim(-5, bin_range[1])
@@ -82,27 +70,9 @@ def plot_histogram(
 
     # Inset plot
     ax_inset = inset_axes(ax_main, width="40%", height="40%", borderpad=1)
-    sns.histplot(
-        pd.to_timedelta(filtered_df[column]).dt.total_seconds(),
-        bins=num_bins,
-        binrange=bin_range,
-        kde=False,
-        color="#BB0700",
-        edgecolor="black",
-        stat="probability",
-        ax=ax_inset,
-    )
-    if streaming_df is not None:
-        sns.histplot(
-            streaming_df["time_difference_seconds"],
-            bins=num_bins,
-            binrange=bin_range,
-            kde=False,
-            color="#0762CF",
-            edgecolor="black",
-            stat="probability",
-            ax=ax_inset,
-        )
+    draw_histogram(ax_inset, tables["count"], "#BB0700")
+    if "streaming" in tables:
+        draw_histogram(ax_inset, tables["streaming"], "#0762CF")
     ax_inset.set_xlim(-10, 600)
     ax_inset.set_ylim(0, 1)
 
@@ -120,26 +90,44 @@ def plot_histogram(
     # Adjust layout to make sure everything fits
     plt.tight_layout()
 
-    plt.savefig(filename, dpi=600)  # Increase dpi to 600 for higher resolution
+    plt.savefig(filename, dpi=figure_dpi())  # 600 dpi unless previewing
     plt.close()
 
 
 def main():
-    df, offload_dict, streaming_dfs = read_and_prepare_data()
+    df, offload_times, streaming_dfs = read_and_prepare_data()
     bin_range = (0, 600)
     num_bins = 200
+    bin_tables = {}
+    figures = []
     for size in [128, 256, 512, 1024]:
         size_str = str(size)
         streaming_df = streaming_dfs.get(size_str, None)
-        offload_time = offload_dict.get(size, 0)
-        plot_histogram(
-            df,
-            streaming_df,
-            size,
-            "elapsed",
-            "Elapsed Time (s)",
-            f"/streaming_analysis/plots/transfer_histogram_{size}.png",
-            bin_range,
-            num_bins,
-            offload_time,
+        tables = prepare_tables(
+            df, streaming_df, size, "elapsed", bin_range, num_bins, offload_times
+        )
+        for series, table in tables.items():
+            bin_tables[(size, series)] = table
+
+        # Each size is rendered as an independent figure
+        figures.append(
+            (
+                plot_histogram,
+                (
+                    tables,
+                    "Elapsed Time (s)",
+                    f"/streaming_analysis/plots/transfer_histogram_{size}.png",
+                    bin_range,
+                ),
+            )
         )
+    render_figures(figures)
+
+    # Export the bin tables so the figures can be redrawn without the raw data
+    export_histograms(
+        bin_tables, "/streaming_analysis/data/outputs/transfer_histogram_bins.csv"
+    )
+
+
+if __name__ == "__main__":
+    main()
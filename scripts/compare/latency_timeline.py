@@ -0,0 +1,238 @@
+import sys
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import (
+    STREAMING_SIZES,
+    load_mean_save_times,
+    load_merged_job_info,
+    load_save_overhead,
+    load_streaming_dfs,
+)
+from common.offload import OffloadTimes
+from common.rendering import figure_dpi, render_figures
+
+# Stages of one scan, in order. Each ends at the event of the same name:
+# acquisition -> offload -> submit -> queue (start) -> count -> save (visible)
+STAGES = ["offload", "submit", "queue", "count", "save"]
+STAGE_COLORS = {
+    "offload": "#F2A541",
+    "submit": "#7F7F7F",
+    "queue": "#BB0700",
+    "count": "#0762CF",
+    "save": "#4CAF50",
+}
+
+TIMELINE_PERCENTILES = [50, 90, 99]
+# Scans whose latency ranks within this many percentile points of a
+# percentile are averaged for its breakdown
+PERCENTILE_BAND = 2.5
+
+
+def file_transfer_timeline(merged_df, offload_times, save_times, save_overhead):
+    """One row per count job of the job history, keyed by Slurm and distiller id.
+
+    Offload and save are not recorded per job, so they come from the offload
+    experiments (through OFFLOAD_MODEL) and the save time measurements of the
+    size. The count excludes the save and the doubled save overhead, as in the
+    compare stages. Nothing is recorded between the end of the offload and the
+    submission, so that stage is zero.
+    """
+    df = merged_df.dropna(subset=["Submit", "Start", "elapsed"])
+    size = df["size"].astype(int)
+    timeline = pd.DataFrame(
+        {
+            "path": "file_transfer",
+            "size": size,
+            "slurm_job_id": df["Job ID"],
+            "distiller_id": df["id"].astype(int),
+            "scan_number": pd.NA,
+        }
+    )
+    timeline["offload"] = np.nan
+    for value, index in timeline.groupby("size").groups.items():
+        timeline.loc[index, "offload"] = offload_times.add(
+            np.zeros(len(index)), value, per_job=True
+        )
+    timeline["submit"] = 0.0
+    timeline["queue"] = (df["Start"] - df["Submit"]).dt.total_seconds()
+    timeline["save"] = size.map(save_times).astype(float)
+    timeline["count"] = (
+        df["elapsed"].dt.total_seconds()
+        - size.map(save_overhead).astype(float) * 2
+        - timeline["save"]
+    ).clip(lower=0)
+
+    timeline["acquisition_time"] = df["Submit"] - pd.to_timedelta(
+        timeline["offload"] + timeline["submit"], unit="s"
+    )
+    timeline["visible_time"] = df["Start"] + pd.to_timedelta(
+        timeline["count"] + timeline["save"], unit="s"
+    )
+    return timeline
+
+
+def streaming_timeline(streaming_dfs, save_times):
+    """One row per streamed scan, keyed by scan number and distiller id.
+
+    Frames are counted while they are acquired, so there is no offload,
+    submission or queue; the save time of the size is split off the latency.
+    """
+    timelines = []
+    for size, streaming_df in streaming_dfs.items():
+        latency = streaming_df["time_difference_seconds"]
+        save = min(save_times.get(int(size), 0.0), latency.min())
+        timelines.append(
+            pd.DataFrame(
+                {
+                    "path": "streaming",
+                    "size": int(size),
+                    "slurm_job_id": pd.NA,
+                    "distiller_id": streaming_df["distiller_id"],
+                    "scan_number": streaming_df["scan_number"],
+                    "offload": 0.0,
+                    "submit": 0.0,
+                    "queue": 0.0,
+                    "count": latency - save,
+                    "save": save,
+                    "acquisition_time": streaming_df["ncem_created_time"],
+                    "visible_time": streaming_df["nersc_write_time"],
+                }
+            )
+        )
+    return pd.concat(timelines, ignore_index=True)
+
+
+def add_totals(timeline):
+    """Total latency, the stage that dominates it and its percentile rank."""
+    timeline["total"] = timeline[STAGES].sum(axis=1)
+    timeline["dominant_stage"] = timeline[STAGES].idxmax(axis=1)
+    timeline["percentile"] = (
+        timeline.groupby(["path", "size"])["total"].rank(method="first", pct=True) * 100
+    )
+    return timeline
+
+
+def critical_path(timeline):
+    """Mean stage times of the scans around each of TIMELINE_PERCENTILES."""
+    rows = []
+    for q in TIMELINE_PERCENTILES:
+        band = timeline[
+            (timeline["percentile"] >= q - PERCENTILE_BAND)
+            & (timeline["percentile"] <= q + PERCENTILE_BAND)
+        ]
+        breakdown = band.groupby(["path", "size"])[STAGES + ["total"]].mean()
+        breakdown["scans"] = band.groupby(["path", "size"]).size()
+        breakdown["dominant_stage"] = breakdown[STAGES].idxmax(axis=1)
+        breakdown["dominant_share"] = breakdown[STAGES].max(axis=1) / breakdown["total"]
+        breakdown.insert(0, "percentile", q)
+        rows.append(breakdown.reset_index())
+    return pd.concat(rows, ignore_index=True)
+
+
+def plot_critical_path(breakdown, filename):
+    """Share of each stage in the latency per size, streaming beside file transfer.
+
+    The bars are stacked to 100%, since the two paths differ by orders of
+    magnitude; the total latency is written above each bar.
+    """
+    sns.set_style("ticks")
+    fig, axes = plt.subplots(
+        1, len(TIMELINE_PERCENTILES), figsize=(10, 3.5), sharey=True
+    )
+    sizes = [int(size) for size in STREAMING_SIZES]
+    positions = np.arange(len(sizes))
+    width = 0.38
+
+    for ax, q in zip(axes, TIMELINE_PERCENTILES):
+        for offset, path in [(-width / 2, "streaming"), (width / 2, "file_transfer")]:
+            rows = breakdown[
+                (breakdown["percentile"] == q) & (breakdown["path"] == path)
+            ]
+            rows = rows.set_index("size").reindex(sizes)
+            totals = rows["total"].to_numpy()
+            bottom = np.zeros(len(sizes))
+            for stage in STAGES:
+                heights = np.nan_to_num(rows[stage].to_numpy() / totals)
+                ax.bar(
+                    positions + offset,
+                    heights,
+                    width,
+                    bottom=bottom,
+                    color=STAGE_COLORS[stage],
+                    edgecolor="black",
+                    linewidth=0.3,
+                    label=(
+                        stage
+                        if (q, path) == (TIMELINE_PERCENTILES[0], "streaming")
+                        else None
+                    ),
+                )
+                bottom += heights
+            for position, total in zip(positions + offset, totals):
+                if not np.isnan(total):
+                    ax.text(
+                        position,
+                        1.02,
+                        f"{total:.0f}",
+                        ha="center",
+                        fontsize=6,
+                        rotation=90,
+                    )
+        ax.set_title(f"p{q}", fontsize=10, pad=18)
+        ax.set_xticks(positions)
+        ax.set_xticklabels([f"{size}\nS | FT" for size in sizes], fontsize=8)
+        ax.set_ylim(0, 1)
+
+    axes[0].set_ylabel("Share of latency")
+    fig.legend(loc="upper center", ncol=len(STAGES), fontsize=8, frameon=False)
+    plt.tight_layout(rect=[0, 0, 1, 0.9])
+    plt.savefig(filename, dpi=figure_dpi())
+    plt.close()
+
+
+def main():
+    save_times = load_mean_save_times()["Real"].to_dict()
+    timeline = pd.concat(
+        [
+            streaming_timeline(load_streaming_dfs(), save_times),
+            file_transfer_timeline(
+                load_merged_job_info(),
+                OffloadTimes(),
+                save_times,
+                load_save_overhead(),
+            ),
+        ],
+        ignore_index=True,
+    )
+    timeline = add_totals(timeline)
+    breakdown = critical_path(timeline)
+
+    timeline.to_csv(
+        "/streaming_analysis/data/outputs/latency_timeline.csv", index=False
+    )
+    breakdown.to_csv("/streaming_analysis/data/outputs/critical_path.csv", index=False)
+    print(
+        breakdown[
+            ["percentile", "path", "size", "total", "dominant_stage", "dominant_share"]
+        ].to_string(index=False)
+    )
+
+    render_figures(
+        [
+            (
+                plot_critical_path,
+                (breakdown, "/streaming_analysis/plots/critical_path.png"),
+            )
+        ]
+    )
+
+
+if __name__ == "__main__":
+    main()
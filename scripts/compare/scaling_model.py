@@ -0,0 +1,251 @@
+import argparse
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.bootstrap import CONFIDENCE_LEVEL, N_RESAMPLES, bootstrap_distributions
+from common.datasets import (
+    load_merged_job_info,
+    load_save_overhead,
+    load_streaming_dfs,
+)
+from common.experiments import calculate_data_gb, calculate_scan_gb
+from common.offload import OffloadTimes
+
+OUTPUT_DIRECTORY = Path("/streaming_analysis/data/outputs")
+
+# Fixed so that the projected intervals are reproducible
+SCALING_SEED = 20231017
+
+SIZES = [128, 256, 512, 1024]
+
+PATHS = ["streaming", "file_transfer"]
+
+# Latencies are recorded to the second; the rounding error (uniform over one
+# second) is added to the measured spread so no size gets an exact mean
+TIME_RESOLUTION = 1.0
+
+# Scans projected by default, as "SCANxSCAN" or "SCANxSCAN:FRAMExFRAME"
+PROJECTIONS = ["2048x2048", "1024x2048", "4096x4096", "1024x1024:1024x1024"]
+
+
+def read_scan_latencies(sizes):
+    """One row per measured scan (streaming) or job (file transfer), with its
+    latency in seconds, as in statistics_transfer_times.py but with outliers."""
+    merged_df = load_merged_job_info()
+    streaming_dfs = load_streaming_dfs()
+    save_overhead = load_save_overhead()
+    offload_times = OffloadTimes()
+
+    frames = []
+    for size in sizes:
+        elapsed_seconds = merged_df.loc[
+            merged_df["size"] == float(size), "Elapsed"
+        ].dt.total_seconds()
+        elapsed_seconds = offload_times.add(elapsed_seconds, size, per_job=True)
+        elapsed_seconds -= save_overhead.get(int(size), 0) * 2
+        latencies = {
+            "streaming": streaming_dfs[str(size)]["time_difference_seconds"],
+            "file_transfer": elapsed_seconds,
+        }
+        for path, latency in latencies.items():
+            latency = np.asarray(latency, dtype=float)
+            latency = latency[~np.isnan(latency)]
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "path": path,
+                        "size": size,
+                        "gigabytes": calculate_data_gb(size),
+                        "latency": latency,
+                    }
+                )
+            )
+    return pd.concat(frames, ignore_index=True)
+
+
+def weighted_line(x, y, weights):
+    """Weighted least squares (intercept, slope) of y against x.
+
+    y may be a (n_resamples, len(x)) matrix, giving one line per row.
+    """
+    design = np.column_stack([np.ones_like(x), x])
+    weighted = design.T * weights
+    return np.linalg.solve(weighted @ design, weighted @ np.asarray(y).T)
+
+
+def chi2_survival(chi2, dof):
+    """P(X >= chi2) for X chi-squared with dof degrees of freedom.
+
+    Uses the Wilson-Hilferty normal approximation of the cube root of X / dof
+    (0.0486 instead of 0.05 at the 5% point of two degrees of freedom).
+    """
+    z = ((chi2 / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class ScalingModel:
+    """Latency = fixed overhead + gigabytes / throughput, for one path.
+
+    The line is fitted to the latency of every scan, each weighted by the
+    inverse variance of the scans of its size. Its uncertainty comes from
+    resampling the scans within each size; the line depends on a resample
+    only through the means of the sizes, so those are what is resampled.
+
+    The misfit of the size means to the line is measured by their reduced
+    chi-squared. When the means scatter more than their errors allow, the
+    resampled lines are spread out by its square root (the covariance is
+    scaled by it), and the fit is flagged as inadequate when the misfit is
+    significant at 1 - CONFIDENCE_LEVEL. Adding the per-scan spread, itself
+    linear in gigabytes, gives prediction intervals for a single scan.
+    """
+
+    def __init__(self, scans, rng, n_resamples=N_RESAMPLES):
+        groups = [group for _, group in scans.groupby("size", sort=True)]
+        x = np.array([group["gigabytes"].iloc[0] for group in groups])
+        n = np.array([len(group) for group in groups], dtype=float)
+        mean = np.array([group["latency"].mean() for group in groups])
+        std = np.array(
+            [
+                np.sqrt(group["latency"].var() + TIME_RESOLUTION**2 / 12)
+                for group in groups
+            ]
+        )
+
+        self.rng = rng
+        scan_weights = 1 / std**2
+        self.overhead, self.seconds_per_gb = weighted_line(
+            scans["gigabytes"].to_numpy(dtype=float),
+            scans["latency"].to_numpy(dtype=float),
+            np.repeat(scan_weights, n.astype(int)),
+        )
+
+        # Weighted least squares on the scans is the same as on the size means
+        # with weights n / variance, the inverse variance of each mean
+        weights = n * scan_weights
+        residuals = mean - (self.overhead + self.seconds_per_gb * x)
+        self.dof = len(x) - 2
+        chi2 = np.sum(weights * residuals**2)
+        self.reduced_chi2 = chi2 / self.dof
+        self.misfit_p = chi2_survival(chi2, self.dof)
+        self.adequate = self.misfit_p >= 1 - CONFIDENCE_LEVEL
+        inflation = np.sqrt(max(1.0, self.reduced_chi2))
+
+        resampled_means = np.column_stack(
+            [
+                bootstrap_distributions(group["latency"], rng, n_resamples)[0]["Mean"]
+                for group in groups
+            ]
+        )
+        fitted = np.array([[self.overhead], [self.seconds_per_gb]])
+        self.resampled_lines = fitted + inflation * (
+            weighted_line(x, resampled_means, weights) - fitted
+        )
+        self.spread_line = weighted_line(x, std, np.ones_like(x))
+        self.min_spread = std.min()
+
+    def spread(self, gigabytes):
+        intercept, slope = self.spread_line
+        return np.maximum(intercept + slope * gigabytes, self.min_spread)
+
+    def predict(self, gigabytes):
+        """Mean latency with its interval and the prediction interval of a scan."""
+        overheads, slopes = self.resampled_lines
+        means = overheads + slopes * gigabytes
+        scans = means + self.rng.standard_normal(len(means)) * self.spread(gigabytes)
+        return {
+            "latency_mean": self.overhead + self.seconds_per_gb * gigabytes,
+            "latency_mean_low": np.quantile(means, (1 - CONFIDENCE_LEVEL) / 2),
+            "latency_mean_high": np.quantile(means, (1 + CONFIDENCE_LEVEL) / 2),
+            "prediction_low": np.quantile(scans, (1 - CONFIDENCE_LEVEL) / 2),
+            "prediction_high": np.quantile(scans, (1 + CONFIDENCE_LEVEL) / 2),
+        }
+
+    def summary(self):
+        overheads, slopes = self.resampled_lines
+        tails = [(1 - CONFIDENCE_LEVEL) / 2, (1 + CONFIDENCE_LEVEL) / 2]
+        gb_per_s_low, gb_per_s_high = np.quantile(1 / slopes, tails)
+        overhead_low, overhead_high = np.quantile(overheads, tails)
+        return {
+            "overhead_s": self.overhead,
+            "overhead_low": overhead_low,
+            "overhead_high": overhead_high,
+            "gb_per_s": 1 / self.seconds_per_gb,
+            "gb_per_s_low": gb_per_s_low,
+            "gb_per_s_high": gb_per_s_high,
+            "reduced_chi2": self.reduced_chi2,
+            "misfit_p": self.misfit_p,
+            "adequate": self.adequate,
+        }
+
+
+def parse_scan(text):
+    """(scan_x, scan_y, frame_x, frame_y) from "2048x2048" or "2048x2048:1024x1024"."""
+    scan, _, frame = text.partition(":")
+    scan_x, scan_y = (int(n) for n in scan.split("x"))
+    frame_x, frame_y = (int(n) for n in (frame or "576x576").split("x"))
+    return scan_x, scan_y, frame_x, frame_y
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit latency against data size for streaming and file "
+        "transfer and project it to larger scans."
+    )
+    parser.add_argument(
+        "--scan",
+        action="append",
+        metavar="SCANxSCAN[:FRAMExFRAME]",
+        help="Scan to project; the frame defaults to 576x576 (default: "
+        f"{', '.join(PROJECTIONS)})",
+    )
+    args = parser.parse_args()
+
+    scans = read_scan_latencies(SIZES)
+    fits = []
+    projections = []
+    for path in PATHS:
+        rng = np.random.default_rng([SCALING_SEED, len(fits)])
+        model = ScalingModel(scans[scans["path"] == path], rng)
+        fits.append({"path": path, **model.summary()})
+        if not model.adequate:
+            print(
+                f"{path}: the line does not fit the size means (reduced "
+                f"chi-squared {model.reduced_chi2:.1f}); its intervals are "
+                "widened by the misfit, but the projections are extrapolations "
+                "of an inadequate model"
+            )
+
+        for text in args.scan or PROJECTIONS:
+            scan_x, scan_y, frame_x, frame_y = parse_scan(text)
+            gigabytes = calculate_scan_gb(scan_x, scan_y, frame_x, frame_y)
+            prediction = model.predict(gigabytes)
+            projections.append(
+                {
+                    "path": path,
+                    "scan": f"{scan_x}x{scan_y}",
+                    "frame": f"{frame_x}x{frame_y}",
+                    "gigabytes": gigabytes,
+                    **prediction,
+                    "effective_gb_per_s": gigabytes / prediction["latency_mean"],
+                    "adequate": model.adequate,
+                }
+            )
+
+    fits_df = pd.DataFrame(fits)
+    projections_df = pd.DataFrame(projections)
+    fits_df.to_csv(OUTPUT_DIRECTORY / "scaling_model_fit.csv", index=False)
+    projections_df.to_csv(
+        OUTPUT_DIRECTORY / "scaling_model_projections.csv", index=False
+    )
+    print(fits_df.to_string(index=False))
+    print(projections_df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import (
+    STREAMING_SIZES,
+    load_mean_save_times,
+    load_merged_job_info,
+    load_save_overhead,
+    load_streaming_dfs,
+)
+from common.experiments import ACQUISITION_INTERVALS, calculate_data_gb
+from common.offload import OFFLOAD_PER_SCAN_PATH
+
+# Fixed so that repeated simulations give the same table
+SIMULATION_SEED = 20231013
+
+LATENCY_PERCENTILES = [50, 95, 99]
+
+# Columns that only describe a queue in steady state. At a utilization of one
+# or more the queue grows without bound, so their values depend on how many
+# scans were simulated and they are left empty
+STEADY_STATE_COLUMNS = (
+    ["backlog_final", "backlog_max", "latency_mean"]
+    + [f"latency_p{q}" for q in LATENCY_PERCENTILES]
+    + ["latency_max"]
+)
+
+
+def fifo_departures(arrivals, services):
+    """Departure times of a single first-in first-out server, without a loop.
+
+    Unrolling D[n] = max(D[n-1], A[n]) + S[n] gives
+    D[n] = C[n] + max over k <= n of (A[k] - C[k-1]), with C the cumulative
+    service time, so one cumsum and one running maximum are enough.
+    """
+    completed = np.cumsum(services)
+    return completed + np.maximum.accumulate(arrivals - (completed - services))
+
+
+def multi_server_departures(arrivals, services, servers):
+    """Departures with jobs handed round-robin to servers FIFO servers.
+
+    This is an upper bound on a shared queue (a job can wait for its server
+    while another is idle), but keeps every server vectorized. With servers
+    None every job starts when it arrives.
+    """
+    if servers is None:
+        return arrivals + services
+    if servers == 1:
+        return fifo_departures(arrivals, services)
+    departures = np.empty_like(arrivals)
+    for server in range(servers):
+        departures[server::servers] = fifo_departures(
+            arrivals[server::servers], services[server::servers]
+        )
+    return departures
+
+
+def simulate_streaming(arrivals, count, save, servers=1):
+    """Every scan holds the streaming pipeline while it is streamed and counted,
+    then is saved without blocking the next scan.
+
+    Only the count part of the measured latency is serialized; the save is a
+    delay after it, as in latency_timeline.py.
+    """
+    return multi_server_departures(arrivals, count, servers) + save
+
+
+def simulate_file_transfer(arrivals, offload, queue_wait, count, servers=None):
+    """Offload over one link, wait in the Slurm queue, then count and save.
+
+    The queue wait is a delay rather than a server, so jobs can overtake each
+    other there; they are counted in the order they start.
+    """
+    offloaded = fifo_departures(arrivals, offload)
+    submitted = offloaded + queue_wait
+    order = np.argsort(submitted, kind="stable")
+    departures = np.empty_like(arrivals)
+    departures[order] = multi_server_departures(submitted[order], count[order], servers)
+    return departures
+
+
+def backlog_at_arrivals(arrivals, departures):
+    """Scans in the system (not yet finished) when each scan arrives."""
+    finished = np.searchsorted(np.sort(departures), arrivals, side="right")
+    return np.arange(1, len(arrivals) + 1) - finished
+
+
+def summarize(path, size, interval, arrivals, departures, capacity):
+    """One row of the simulation table; capacity is in scans per second.
+
+    A path whose utilization is one or more is reported as unstable, with the
+    steady-state columns left empty; its backlog growth is still given.
+    """
+    gigabytes = calculate_data_gb(size)
+    utilization = 1 / (interval * capacity)
+    latency = departures - arrivals
+    backlog = backlog_at_arrivals(arrivals, departures)
+    # Least squares slope of the backlog against time, in scans per hour
+    growth = np.polyfit(arrivals, backlog, 1)[0] * 3600
+    row = {
+        "size": size,
+        "interval": interval,
+        "path": path,
+        "scans": len(arrivals),
+        "offered_gb_per_s": gigabytes / interval,
+        "sustainable_gb_per_s": gigabytes * capacity,
+        "utilization": utilization,
+        "status": "stable" if utilization < 1 else "unstable",
+        "backlog_final": int(backlog[-1]),
+        "backlog_max": int(backlog.max()),
+        "backlog_growth_per_hour": growth,
+        "latency_mean": latency.mean(),
+    }
+    for q, value in zip(
+        LATENCY_PERCENTILES, np.percentile(latency, LATENCY_PERCENTILES)
+    ):
+        row[f"latency_p{q}"] = value
+    row["latency_max"] = latency.max()
+    if utilization >= 1:
+        for column in STEADY_STATE_COLUMNS:
+            row[column] = np.nan
+    return row
+
+
+def load_distributions():
+    """{size: {stage: measured seconds}} for every size with streaming data.
+
+    The streaming latency is split into its count part and the mean save time
+    of the size (a constant), as in latency_timeline.py.
+    """
+    merged_df = load_merged_job_info()
+    streaming_dfs = load_streaming_dfs()
+    save_overhead = load_save_overhead()
+    save_times = load_mean_save_times()["Real"].to_dict()
+    offload_df = pd.read_csv(OFFLOAD_PER_SCAN_PATH)
+
+    distributions = {}
+    for size in STREAMING_SIZES:
+        jobs = merged_df[merged_df["size"] == float(size)]
+        jobs = jobs.dropna(subset=["Submit", "Start", "elapsed"])
+        latency = streaming_dfs[size]["time_difference_seconds"].to_numpy(dtype=float)
+        save = min(save_times.get(int(size), 0.0), latency.min())
+        distributions[size] = {
+            "streaming_count": latency - save,
+            "streaming_save": save,
+            "offload": offload_df.loc[
+                offload_df["size"] == int(size), "offload_time"
+            ].to_numpy(dtype=float),
+            "queue_wait": (jobs["Start"] - jobs["Submit"])
+            .dt.total_seconds()
+            .to_numpy(),
+            # Count time without the save overhead, as in the compare stages
+            "count": jobs["elapsed"].dt.total_seconds().to_numpy()
+            - save_overhead.get(int(size), 0) * 2,
+        }
+    return distributions
+
+
+def simulate(distributions, size, interval, n_scans, streaming_servers, count_servers):
+    """Simulate n_scans acquisitions of size every interval seconds."""
+    measured = distributions[size]
+    rng = np.random.default_rng([SIMULATION_SEED, int(size)])
+    samples = {
+        stage: rng.choice(values, size=n_scans)
+        for stage, values in measured.items()
+        if stage != "streaming_save"
+    }
+    arrivals = np.arange(n_scans) * float(interval)
+
+    streaming = simulate_streaming(
+        arrivals,
+        samples["streaming_count"],
+        measured["streaming_save"],
+        streaming_servers,
+    )
+    file_transfer = simulate_file_transfer(
+        arrivals,
+        samples["offload"],
+        samples["queue_wait"],
+        samples["count"],
+        count_servers,
+    )
+
+    # Scans per second the slowest server stage can sustain
+    streaming_capacity = streaming_servers / measured["streaming_count"].mean()
+    file_transfer_capacity = 1 / measured["offload"].mean()
+    if count_servers is not None:
+        file_transfer_capacity = min(
+            file_transfer_capacity, count_servers / measured["count"].mean()
+        )
+    return [
+        summarize("streaming", size, interval, arrivals, streaming, streaming_capacity),
+        summarize(
+            "file_transfer",
+            size,
+            interval,
+            arrivals,
+            file_transfer,
+            file_transfer_capacity,
+        ),
+    ]
+
+
+def parse_intervals(overrides):
+    """ACQUISITION_INTERVALS with SIZE=SECONDS overrides applied."""
+    intervals = dict(ACQUISITION_INTERVALS)
+    for override in overrides:
+        size, seconds = override.split("=")
+        if size not in intervals:
+            raise ValueError(f"No measurements for size {size}")
+        intervals[size] = float(seconds)
+    return intervals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulate streaming and file transfer over a long run of "
+        "acquisitions, from the measured time distributions."
+    )
+    parser.add_argument(
+        "--scans", type=int, default=1_000_000, help="Acquisitions per size"
+    )
+    parser.add_argument(
+        "--interval",
+        action="append",
+        default=[],
+        metavar="SIZE=SECONDS",
+        help="Seconds between scans of a size (default: the paper's intervals)",
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", default=STREAMING_SIZES, choices=STREAMING_SIZES
+    )
+    parser.add_argument(
+        "--streaming-servers",
+        type=int,
+        default=1,
+        help="Scans the streaming pipeline processes at once",
+    )
+    parser.add_argument(
+        "--count-servers",
+        type=int,
+        default=None,
+        help="Count jobs that can run at once (default: no limit)",
+    )
+    parser.add_argument(
+        "--output",
+        default="/streaming_analysis/data/outputs/backlog_simulation.csv",
+    )
+    args = parser.parse_args()
+
+    intervals = parse_intervals(args.interval)
+    distributions = load_distributions()
+    rows = []
+    for size in args.sizes:
+        rows += simulate(
+            distributions,
+            size,
+            intervals[size],
+            args.scans,
+            args.streaming_servers,
+            args.count_servers,
+        )
+
+    results_df = pd.DataFrame(rows)
+    # Empty for unstable paths; keep the counts integer
+    for column in ["backlog_final", "backlog_max"]:
+        results_df[column] = results_df[column].astype("Int64")
+    results_df.to_csv(args.output, index=False)
+    print(results_df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,12 @@
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-def calculate_data_gb(size):
-    _size = int(size)
-    total_pixels = _size * _size * 576 * 576
-    bit_per_pixel = 16
-    byte_per_pixel = bit_per_pixel / 8
-    bytes_per_dataset = total_pixels * byte_per_pixel
-    gigabytes_per_dataset = bytes_per_dataset * 1e-9
-    return gigabytes_per_dataset
+from common.experiments import calculate_data_gb
 
 
 def read_statistics(size):
@@ -22,29 +17,57 @@ def read_statistics(size):
 
     streaming_row = df[df["Statistics"].str.contains("Streaming without Outliers")]
     file_transfer_row = df[df["Statistics"].str.contains("Original without Outliers")]
+    enhancement_row = df[df["Statistics"].str.contains("Enhancement")]
 
     streaming_mean = streaming_row["Mean time"].values[0]
     streaming_std = streaming_row["Standard Deviation"].values[0]
+    streaming_ci = (
+        streaming_row["Mean CI low"].values[0],
+        streaming_row["Mean CI high"].values[0],
+    )
 
     file_transfer_mean = file_transfer_row["Mean time"].values[0]
     file_transfer_std = file_transfer_row["Standard Deviation"].values[0]
+    file_transfer_ci = (
+        file_transfer_row["Mean CI low"].values[0],
+        file_transfer_row["Mean CI high"].values[0],
+    )
 
     enhancement = file_transfer_mean / streaming_mean
+    enhancement_ci = (
+        enhancement_row["Enhancement CI low"].values[0],
+        enhancement_row["Enhancement CI high"].values[0],
+    )
     gigabytes = calculate_data_gb(size)
     return (
         gigabytes,
         file_transfer_mean,
         file_transfer_std,
+        file_transfer_ci,
         streaming_mean,
         streaming_std,
+        streaming_ci,
         enhancement,
+        enhancement_ci,
     )
 
 
+def format_interval(interval):
+    """Format a bootstrap confidence interval as {[low, high]}.
+
+    The braces keep a preceding \\\\ from reading the brackets as its
+    optional [<dim>] argument.
+    """
+    low, high = interval
+    return f"{{[{low:.1f}, {high:.1f}]}}"
+
+
 def main():
     sizes = [128, 256, 512, 1024]
     caption = (
-        "Comparison of file transfer and streaming times for various data dimensions."
+        "Comparison of file transfer and streaming times for various data dimensions. "
+        "Brackets give 95\\% bootstrap confidence intervals of the means and of "
+        "the enhancement."
     )
 
     latex_table = []
@@ -65,12 +88,15 @@ def main():
             gigabytes,
             file_transfer_mean,
             file_transfer_std,
+            file_transfer_ci,
             streaming_mean,
             streaming_std,
+            streaming_ci,
             enhancement,
+            enhancement_ci,
         ) = read_statistics(size)
         latex_table.append(
-            f"{size} x {size} x 576 x 576 & {int(gigabytes)} GB & ${file_transfer_mean:.1f} \pm {file_transfer_std:.1f}$ & ${streaming_mean:.1f} \pm {streaming_std:.1f}$ & {enhancement:.1f} \\\\"
+            f"{size} x {size} x 576 x 576 & {int(gigabytes)} GB & \\makecell{{${file_transfer_mean:.1f} \pm {file_transfer_std:.1f}$ \\\\ {format_interval(file_transfer_ci)}}} & \\makecell{{${streaming_mean:.1f} \pm {streaming_std:.1f}$ \\\\ {format_interval(streaming_ci)}}} & \\makecell{{{enhancement:.1f} \\\\ {format_interval(enhancement_ci)}}} \\\\"
         )
 
     latex_table.append(r"\bottomrule")
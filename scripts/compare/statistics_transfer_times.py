@@ -1,88 +1,89 @@
+import sys
 from pathlib import Path
 
 import pandas as pd
 
-filename_map = {
-    "128": "streaming_times_128.csv",
-    "256": "streaming_times_256.csv",
-    "512": "streaming_times_512.csv",
-    "1024": "streaming_times_1024.csv",
-}
-
-
-def remove_outliers(data):
-    """Remove outliers based on IQR."""
-    Q1 = data.quantile(0.25)
-    Q3 = data.quantile(0.75)
-    IQR = Q3 - Q1
-    return data[~((data < (Q1 - 1.5 * IQR)) | (data > (Q3 + 1.5 * IQR)))]
-
-
-def calculate_and_write_stats(df, column, stats_dict, size, section_title):
-    """Calculate basic statistics and append to a dictionary."""
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.bootstrap import (
+    bootstrap_distributions,
+    bootstrap_rng,
+    confidence_interval,
+)
+from common.datasets import (
+    STREAMING_SIZES,
+    load_merged_job_info,
+    load_save_overhead,
+    load_streaming_dfs,
+)
+from common.offload import OffloadTimes
+from common.sketches import (
+    describe,
+    iqr_mask,
+    monthly_summaries,
+    update_daily_sketches,
+)
+
+
+def remove_outliers(data, stats):
+    """Remove outliers based on IQR, using the quartiles already in stats."""
+    return data[iqr_mask(data, stats["25th percentile"], stats["75th percentile"])]
+
+
+def calculate_and_write_stats(
+    df, column, stats_dict, size, section_title, distributions
+):
+    """Calculate basic statistics and append them, with the bootstrap intervals
+    of the given distributions, to a dictionary."""
     if column is not None:
         data = df[column]
     else:
         data = df  # If column is None, df is actually a Series
 
-    n_points = len(data)
-    mean_time = data.mean()
-    median_time = data.median()
-    std_dev_time = data.std()
-    min_time = data.min()
-    max_time = data.max()
-    quantile_25 = data.quantile(0.25)
-    quantile_75 = data.quantile(0.75)
+    stats = describe(data)
 
     stats_dict[section_title] = {
         "Size": size,
-        "Number of Points": n_points,
-        "Mean time": mean_time,
-        "Median time": median_time,
-        "Standard Deviation": std_dev_time,
-        "Minimum time": min_time,
-        "Maximum time": max_time,
-        "25th percentile": quantile_25,
-        "75th percentile": quantile_75,
+        "Number of Points": len(data),
+        "Mean time": stats["mean"],
+        "Median time": stats["median"],
+        "Standard Deviation": stats["std"],
+        "Minimum time": stats["min"],
+        "Maximum time": stats["max"],
+        "25th percentile": stats["q25"],
+        "75th percentile": stats["q75"],
     }
 
+    for name, distribution in distributions.items():
+        low, high = confidence_interval(distribution)
+        stats_dict[section_title][f"{name} CI low"] = low
+        stats_dict[section_title][f"{name} CI high"] = high
+
 
 def read_and_prepare_data():
     """Read and prepare data for plotting histograms."""
-    df = pd.read_csv("/streaming_analysis/data/file_transfer/merged_job_info.csv")
-    offload_df = pd.read_csv(
-        "/streaming_analysis/data/file_transfer/ncem_offload_times.csv"
-    )
-    offload_dict = dict(zip(offload_df["size"], offload_df["offload_time"]))
+    df = load_merged_job_info()
+    offload_times = OffloadTimes()
 
-    # Make write times
-    write_time_df = pd.read_csv(
-        "/streaming_analysis/data/file_transfer/save_time_stats.csv"
-    )
-    # Get the mean times for everything
-    mean_df = write_time_df[write_time_df["Stat"] == "mean"]
-
-    # Get the save times
-    pivot_df = mean_df.pivot(index="Size", columns="Type", values="save_time")
-
-    # subtract blank time
-    pivot_df["overhead"] = pivot_df["Real"] - pivot_df["Blank"]
+    save_overhead = load_save_overhead()
 
-    # just get the overheads in a dictionary.
-    save_overhead = pivot_df["overhead"].to_dict()
-
-    streaming_dfs = {
-        size: pd.read_csv(f"/streaming_analysis/data/streaming/{filename}")
-        for size, filename in filename_map.items()
-    }
-    return df, offload_dict, streaming_dfs, save_overhead
+    streaming_dfs = load_streaming_dfs()
+    return df, offload_times, streaming_dfs, save_overhead
 
 
 def main():
-    merged_df, offload_dict, streaming_dfs, save_overhead = read_and_prepare_data()
+    merged_df, offload_times, streaming_dfs, save_overhead = read_and_prepare_data()
+    monthly = []
 
-    for size, _ in filename_map.items():
+    for size in STREAMING_SIZES:
         stats_dict = {}
+        rng = bootstrap_rng(size)
+
+        # The raw series are resampled, with the outlier filter applied inside
+        # each resample for the "without Outliers" intervals
+        streaming_raw, streaming_filtered = bootstrap_distributions(
+            streaming_dfs[size]["time_difference_seconds"], rng
+        )
 
         # Calculate statistics for Streaming histograms with outliers
         calculate_and_write_stats(
@@ -91,11 +92,13 @@ def main():
             stats_dict,
             size,
             f"Statistics for {size}x{size} Streaming with Outliers",
+            streaming_raw,
         )
 
         # Calculate statistics for Streaming histograms without outliers
         filtered_streaming_data = remove_outliers(
-            streaming_dfs[size]["time_difference_seconds"]
+            streaming_dfs[size]["time_difference_seconds"],
+            stats_dict[f"Statistics for {size}x{size} Streaming with Outliers"],
         )
         calculate_and_write_stats(
             filtered_streaming_data,
@@ -103,18 +106,18 @@ def main():
             stats_dict,
             size,
             f"Statistics for {size}x{size} Streaming without Outliers",
+            streaming_filtered,
         )
 
         # Filter the merged_df for the current size for Original histograms
         filtered_merged_df = merged_df[merged_df["size"] == float(size)]
-        elapsed_seconds = pd.to_timedelta(
-            filtered_merged_df["Elapsed"]
-        ).dt.total_seconds()
+        elapsed_seconds = filtered_merged_df["Elapsed"].dt.total_seconds()
 
-        # Add offload time to Original histograms
-        offload_time = offload_dict.get(int(size), 0)
-        elapsed_seconds += offload_time
+        # Add offload time to Original histograms, one value per job so that
+        # the point counts and bootstrap intervals stay per job
+        elapsed_seconds = offload_times.add(elapsed_seconds, size, per_job=True)
         elapsed_seconds -= save_overhead.get(int(size), 0) * 2  # Subtract 2x overhead
+        original_raw, original_filtered = bootstrap_distributions(elapsed_seconds, rng)
 
         # Calculate statistics for Original histograms with outliers
         calculate_and_write_stats(
@@ -123,26 +126,71 @@ def main():
             stats_dict,
             size,
             f"Statistics for {size}x{size} Original with Outliers",
+            original_raw,
         )
 
         # Calculate statistics for Original histograms without outliers
-        filtered_original_data = remove_outliers(elapsed_seconds)
+        filtered_original_data = remove_outliers(
+            elapsed_seconds,
+            stats_dict[f"Statistics for {size}x{size} Original with Outliers"],
+        )
         calculate_and_write_stats(
             filtered_original_data,
             None,
             stats_dict,
             size,
             f"Statistics for {size}x{size} Original without Outliers",
+            original_filtered,
         )
 
+        # Enhancement (file transfer mean / streaming mean), one ratio per resample
+        enhancement_low, enhancement_high = confidence_interval(
+            original_filtered["Mean"] / streaming_filtered["Mean"]
+        )
+        stats_dict[f"Enhancement for {size}x{size} without Outliers"] = {
+            "Size": size,
+            "Enhancement": filtered_original_data.mean()
+            / filtered_streaming_data.mean(),
+            "Enhancement CI low": enhancement_low,
+            "Enhancement CI high": enhancement_high,
+        }
+
         # Write all statistics to a single CSV file for each size
         stats_df = pd.DataFrame.from_dict(stats_dict, orient="index")
         stats_df.index.name = "Statistics"
+        # The enhancement row has no point count; keep the column integer
+        stats_df["Number of Points"] = stats_df["Number of Points"].astype("Int64")
         stats_df.to_csv(
             Path("/streaming_analysis/data/outputs")
             / f"statistics_transfers_{size}.csv"
         )
 
+        # Per-day sketches of both series for this size, rebuilt only for days
+        # with new or changed rows, merged into per-month summaries
+        sketch_path = (
+            f"/streaming_analysis/data/cache/sketches/transfer_times_{size}.json"
+        )
+        update_daily_sketches(
+            sketch_path,
+            "streaming",
+            streaming_dfs[size]["nersc_write_time"],
+            streaming_dfs[size]["time_difference_seconds"],
+        )
+        store = update_daily_sketches(
+            sketch_path,
+            "file_transfer",
+            filtered_merged_df["Submit"],
+            elapsed_seconds,
+        )
+        summary = monthly_summaries(store)
+        summary.insert(0, "size", size)
+        monthly.append(summary)
+
+    pd.concat(monthly, ignore_index=True).to_csv(
+        "/streaming_analysis/data/outputs/transfer_statistics_by_month.csv",
+        index=False,
+    )
+
 
 if __name__ == "__main__":
     main()
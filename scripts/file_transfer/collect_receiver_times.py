@@ -0,0 +1,153 @@
+import argparse
+import csv
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+RECEIVERS = range(4)
+
+STATUS_PATTERN = re.compile(r"^4dstem_rec_status_(\d+)_scan_(\d+)\.json$")
+DATA_PATTERN = re.compile(r"^data_scan(\d{10})_.*\.data$")
+
+
+def to_utc_iso(value):
+    """Format a time as the bash scripts did with date --utc, to the second."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def list_receiver_files(directory, with_data):
+    """One directory pass: status JSON paths and newest .data mtime per scan.
+
+    Returns ({scan_number: {receiver: path}}, {scan_number: mtime_ns}).
+    """
+    status_files = {}
+    last_written = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = STATUS_PATTERN.match(entry.name)
+            if match:
+                receiver, scan_number = int(match[1]), int(match[2])
+                status_files.setdefault(scan_number, {})[receiver] = entry.path
+                continue
+            if with_data:
+                match = DATA_PATTERN.match(entry.name)
+                if match:
+                    scan_number = int(match[1])
+                    mtime_ns = entry.stat().st_mtime_ns
+                    if mtime_ns > last_written.get(scan_number, -1):
+                        last_written[scan_number] = mtime_ns
+    return status_files, last_written
+
+
+def read_status_time(path):
+    with open(path, "r") as f:
+        return json.load(f)["time"]
+
+
+def read_known_scans(output_path):
+    """Scan numbers already in the output CSV, read once into a set."""
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "r", newline="") as f:
+        return {int(row["scan_number"]) for row in csv.DictReader(f)}
+
+
+def collect_rows(directory, known_scans, start=0, with_data=True, workers=8):
+    """Rows for the complete scans that are not in known_scans yet.
+
+    A scan is complete once all four receivers have written their status JSON
+    (and, with_data, at least one .data file exists). Incomplete scans are left
+    for a later run instead of being recorded with missing times.
+    """
+    status_files, last_written = list_receiver_files(directory, with_data)
+    scan_numbers = sorted(
+        scan_number
+        for scan_number, receivers in status_files.items()
+        if scan_number >= start
+        and scan_number not in known_scans
+        and all(receiver in receivers for receiver in RECEIVERS)
+        and (not with_data or scan_number in last_written)
+    )
+
+    paths = [status_files[n][receiver] for n in scan_numbers for receiver in RECEIVERS]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        times = list(executor.map(read_status_time, paths))
+
+    rows = []
+    for i, scan_number in enumerate(scan_numbers):
+        receiver_times = times[i * len(RECEIVERS) : (i + 1) * len(RECEIVERS)]
+        if with_data:
+            row = [scan_number] + [to_utc_iso(t) for t in receiver_times]
+            mtime = datetime.fromtimestamp(
+                last_written[scan_number] // 1_000_000_000, tz=timezone.utc
+            )
+            row.append(to_utc_iso(mtime))
+        else:
+            row = [scan_number] + receiver_times
+        rows.append(row)
+    return rows
+
+
+def append_rows(output_path, header, rows, batch_size=500):
+    """Append rows in batches, writing the header if the file is new."""
+    new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    with open(output_path, "a", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        if new_file:
+            writer.writerow(header)
+        for i in range(0, len(rows), batch_size):
+            writer.writerows(rows[i : i + batch_size])
+            f.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Collect receiver status times (and newest .data mtimes) "
+        "per scan into write_times.csv or created_times.csv."
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=".",
+        help="Directory with the 4dstem_rec_status_*_scan_*.json (and .data) files",
+    )
+    parser.add_argument(
+        "--created-times",
+        action="store_true",
+        help="Write scan_number,time0..time3 (created_times.csv) without .data times",
+    )
+    parser.add_argument("--output", help="CSV to append to")
+    parser.add_argument(
+        "--start", type=int, default=0, help="Skip scan numbers below this"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Threads reading status JSON"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=500, help="Rows per appended batch"
+    )
+    args = parser.parse_args()
+
+    with_data = not args.created_times
+    output = args.output or ("write_times.csv" if with_data else "created_times.csv")
+    header = ["scan_number"] + [f"time{receiver}" for receiver in RECEIVERS]
+    if with_data:
+        header.append("time_last_written")
+
+    rows = collect_rows(
+        args.directory,
+        read_known_scans(output),
+        start=args.start,
+        with_data=with_data,
+        workers=args.workers,
+    )
+    append_rows(output, header, rows, args.batch_size)
+    print(f"Added {len(rows)} scans to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,60 @@
+import argparse
 import csv
+import json
 import os
 import subprocess
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from io import StringIO
 
+import pandas as pd
 
-# Function to run a shell command and return the output
+FIELDNAMES = [
+    "Job Name",
+    "Job ID",
+    "Timelimit",
+    "Elapsed",
+    "Submit",
+    "Start",
+    "End",
+    "ReqNodes",
+    "QOS",
+    "User",
+    "ExitCode",
+]
+
+SACCT_FORMAT = (
+    "JobName,JobID,Timelimit,Elapsed,Submit,Start,End,ReqNodes,QOS,User,ExitCode"
+)
+
+# sacct reports no end time for jobs that are still pending or running
+UNFINISHED_END = {"Unknown", "None", ""}
+
+
+# Function to run a command and return the output
 def run_command(command):
+    # Raise on failure so that a failed window/chunk is never checkpointed
     result = subprocess.run(
-        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, shell=True
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
     )
     return result.stdout
 
 
 # Function to extract job information for multiple job IDs
 def extract_multiple_job_info(job_ids):
+    """Rows of the finished jobs, and the submit dates of the unfinished ones."""
     job_info_list = []
+    unfinished = []
     job_ids_str = ",".join(job_ids)
     sacct_output = run_command(
-        f"sacct --user=dstlr -j {job_ids_str} --format=JobName,JobID,Timelimit,Elapsed,Submit,Start,End,ReqNodes,QOS,User,ExitCode --parsable2 --noheader"
+        [
+            "sacct",
+            "--user=dstlr",
+            f"--jobs={job_ids_str}",
+            f"--format={SACCT_FORMAT}",
+            "--parsable2",
+            "--noheader",
+        ]
     )
     lines = sacct_output.strip().split("\n")
 
@@ -27,7 +64,7 @@ def extract_multiple_job_info(job_ids):
         job_info = {}
         main_line = line.split("|")
 
-        if len(main_line) == 0:
+        if len(main_line) < len(FIELDNAMES):
             continue
 
         current_job_id = main_line[1].split(".")[0]
@@ -42,6 +79,11 @@ def extract_multiple_job_info(job_ids):
         if "distiller-count" not in job_info["Job Name"]:
             continue
 
+        # Unfinished jobs are left out so they are fetched again once done
+        if main_line[6] in UNFINISHED_END:
+            unfinished.append(main_line[4][:10])
+            continue
+
         job_info["Job ID"] = main_line[1]
         job_info["Timelimit"] = main_line[2]
         job_info["Elapsed"] = main_line[3]
@@ -63,69 +105,378 @@ def extract_multiple_job_info(job_ids):
 
         job_info_list.append(job_info)
 
-    return job_info_list
+    return job_info_list, unfinished
 
 
-# Function to get job IDs within smaller date ranges
-def get_all_job_ids(start_date, end_date, delta_days=30):
-    job_ids = []
+def date_windows(start_date, end_date, delta_days=30):
+    """Split [start_date, end_date] into contiguous (start, end) windows."""
+    windows = []
     current_start = datetime.strptime(start_date, "%Y-%m-%d")
     final_end = datetime.strptime(end_date, "%Y-%m-%d")
 
-    while current_start <= final_end:
-        current_end = current_start + timedelta(days=delta_days)
-        if current_end > final_end:
-            current_end = final_end
-
-        job_ids_output = run_command(
-            f"sacct --user=dstlr --format=JobID --noheader --starttime={current_start.strftime('%Y-%m-%d')} --endtime={current_end.strftime('%Y-%m-%d')}"
+    while current_start < final_end:
+        current_end = min(current_start + timedelta(days=delta_days), final_end)
+        windows.append(
+            (current_start.strftime("%Y-%m-%d"), current_end.strftime("%Y-%m-%d"))
         )
-        current_job_ids = job_ids_output.strip().split("\n")
+        # sacct treats a bare date as midnight, so the next window starts where
+        # this one ended; jobs straddling the boundary are de-duplicated later.
+        current_start = current_end
 
-        for job_id in current_job_ids:
-            split_job_id = job_id.split()
-            if len(split_job_id) > 0 and not "." in split_job_id[0]:
-                job_ids.append(split_job_id[0])
+    return windows
 
-        current_start = current_end + timedelta(days=1)
 
+# Function to get the job IDs submitted within one date window
+def get_window_job_ids(window):
+    job_ids_output = run_command(
+        [
+            "sacct",
+            "--user=dstlr",
+            "--format=JobID",
+            "--noheader",
+            f"--starttime={window[0]}",
+            f"--endtime={window[1]}",
+        ]
+    )
+
+    job_ids = []
+    for job_id in job_ids_output.strip().split("\n"):
+        split_job_id = job_id.split()
+        if len(split_job_id) > 0 and not "." in split_job_id[0]:
+            job_ids.append(split_job_id[0])
     return job_ids
 
 
+# Function to get the full job information for one date window in a single call
+def get_window_job_info(window, qos=None):
+    command = [
+        "sacct",
+        "--user=dstlr",
+        "--allocations",
+        "--state=COMPLETED",
+        "--nnodes=4",
+        f"--starttime={window[0]}",
+        f"--endtime={window[1]}",
+        f"--format={SACCT_FORMAT}",
+        "--parsable2",
+        "--noheader",
+    ]
+    # QOS can only be filtered exactly by sacct, so it is pushed down only when
+    # the realtime QOS names are known
+    if qos:
+        command.append(f"--qos={qos}")
+    return run_command(command)
+
+
+def filter_job_info(sacct_output):
+    """Apply the filters sacct cannot express in one vectorized pass."""
+    df = pd.read_csv(
+        StringIO(sacct_output),
+        sep="|",
+        names=FIELDNAMES,
+        dtype=str,
+        keep_default_na=False,
+        usecols=range(len(FIELDNAMES)),
+    )
+
+    mask = (
+        ~df["Job ID"].str.contains(".", regex=False)
+        & df["Job Name"].str.contains("distiller-count", regex=False)
+        & ~df["Start"].isin(["Unknown", "None"])
+        & (df["ReqNodes"] == "4")
+        & df["QOS"].str.contains("realtime_", regex=False)
+        & (df["ExitCode"] == "0:0")
+    )
+    return df[mask].to_dict(orient="records")
+
+
+def chunk_key(job_ids):
+    """Stable checkpoint key for a chunk of job IDs."""
+    return f"{job_ids[0]}-{job_ids[-1]}-{len(job_ids)}"
+
+
+class Checkpoint:
+    """Append-only JSON-lines record of finished windows and chunks.
+
+    Every finished unit of work is written as one line, so a harvest that dies
+    part way through loses at most the line being written when it is rerun.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.windows = {}
+        self.chunks = {}
+        self.window_rows = {}
+        self.watermark = None
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partially written last line from an interrupted run
+                        continue
+                    self._apply(record)
+
+    def _apply(self, record):
+        if "window" in record:
+            self.windows[tuple(record["window"])] = record["job_ids"]
+        elif "window_rows" in record:
+            self.window_rows[tuple(record["window_rows"])] = record["rows"]
+        elif "chunk" in record:
+            self.chunks[record["chunk"]] = record["rows"]
+        elif "watermark" in record:
+            self.watermark = record["watermark"]
+
+    def _append(self, record):
+        self._apply(record)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def add_window(self, window, job_ids):
+        self.windows[tuple(window)] = job_ids
+        # Windows that reach today can still gain jobs, so only closed
+        # windows are persisted.
+        if window[1] < date.today().isoformat():
+            self._append({"window": list(window), "job_ids": job_ids})
+
+    def add_window_rows(self, window, rows):
+        self.window_rows[tuple(window)] = rows
+        if window[1] < date.today().isoformat():
+            self._append({"window_rows": list(window), "rows": rows})
+
+    def add_chunk(self, key, rows):
+        self._append({"chunk": key, "rows": rows})
+
+    def set_watermark(self, watermark):
+        if self.watermark is None or watermark > self.watermark:
+            self._append({"watermark": watermark})
+
+
+# Function to get job IDs within smaller date ranges
+def get_all_job_ids(
+    start_date, end_date, delta_days=30, max_workers=4, checkpoint=None
+):
+    windows = date_windows(start_date, end_date, delta_days)
+    done = checkpoint.windows if checkpoint is not None else {}
+    window_job_ids = {window: done[window] for window in windows if window in done}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_window_job_ids, window): window
+            for window in windows
+            if window not in window_job_ids
+        }
+        for future in as_completed(futures):
+            window = futures[future]
+            window_job_ids[window] = future.result()
+            if checkpoint is not None:
+                checkpoint.add_window(window, window_job_ids[window])
+
+    # Keep the window order and drop jobs that were seen in an earlier window
+    job_ids = list(
+        dict.fromkeys(job_id for window in windows for job_id in window_job_ids[window])
+    )
+
+    return job_ids
+
+
+def get_all_job_info_single_pass(
+    start_date, end_date, delta_days=30, max_workers=4, checkpoint=None, qos=None
+):
+    """Fetch and filter job information with one sacct call per date window."""
+    windows = date_windows(start_date, end_date, delta_days)
+    done = checkpoint.window_rows if checkpoint is not None else {}
+    window_rows = {window: done[window] for window in windows if window in done}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_window_job_info, window, qos): window
+            for window in windows
+            if window not in window_rows
+        }
+        for future in as_completed(futures):
+            window = futures[future]
+            window_rows[window] = filter_job_info(future.result())
+            if checkpoint is not None:
+                checkpoint.add_window_rows(window, window_rows[window])
+
+    update_watermark(checkpoint, windows)
+
+    # Keep the window order and drop jobs that were seen in an earlier window
+    job_info = {}
+    for window in windows:
+        for row in window_rows[window]:
+            job_info.setdefault(row["Job ID"], row)
+    return list(job_info.values())
+
+
+def update_watermark(checkpoint, windows, unfinished=()):
+    """Move the watermark to the end of the last closed window.
+
+    It stays at or before the submit date of the oldest unfinished job, so an
+    incremental run queries that job's window again.
+    """
+    if checkpoint is None:
+        return
+    closed = [w[1] for w in windows if w[1] < date.today().isoformat()]
+    if closed:
+        checkpoint.set_watermark(min([max(closed), *unfinished]))
+
+
+def extract_all_job_info(job_ids, chunk_size=100, max_workers=4, checkpoint=None):
+    """Fetch job information in chunks of job IDs through a worker pool.
+
+    Returns the rows of the finished jobs and the submit dates of the
+    unfinished ones. Only chunks whose jobs have all finished are
+    checkpointed, so the others are fetched again on the next run.
+    """
+    chunks = [job_ids[i : i + chunk_size] for i in range(0, len(job_ids), chunk_size)]
+    done = checkpoint.chunks if checkpoint is not None else {}
+    chunk_rows = {
+        i: done[chunk_key(chunk)]
+        for i, chunk in enumerate(chunks)
+        if chunk_key(chunk) in done
+    }
+    unfinished = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(extract_multiple_job_info, chunk): i
+            for i, chunk in enumerate(chunks)
+            if i not in chunk_rows
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            chunk_rows[i], chunk_unfinished = future.result()
+            unfinished += chunk_unfinished
+            if checkpoint is not None and not chunk_unfinished:
+                checkpoint.add_chunk(chunk_key(chunks[i]), chunk_rows[i])
+
+    # Return the rows in the same order as the job IDs
+    return [row for i in range(len(chunks)) for row in chunk_rows[i]], unfinished
+
+
+def read_existing_job_ids(output_file_path):
+    if not os.path.exists(output_file_path):
+        return set()
+    with open(output_file_path, "r", newline="") as csvfile:
+        return {row["Job ID"] for row in csv.DictReader(csvfile)}
+
+
+def write_job_info(output_file_path, job_info_list, append=False):
+    if append and os.path.exists(output_file_path):
+        with open(output_file_path, "a", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writerows(job_info_list)
+        return
+
+    # Write to a temporary file first so an interrupted run never truncates the CSV
+    tmp_path = output_file_path + ".tmp"
+    with open(tmp_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(job_info_list)
+    os.replace(tmp_path, output_file_path)
+
+
+def parse_args():
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Harvest distiller-count job information from sacct."
+    )
+    parser.add_argument("--start-date", default="2021-01-01")
+    parser.add_argument(
+        "--end-date",
+        default=None,
+        help="Default: 2023-10-12, or today with --incremental",
+    )
+    parser.add_argument(
+        "--output", default=os.path.join(script_directory, "/data/slurm_job_info.csv")
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Checkpoint file (default: <output>.checkpoint.jsonl)",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delta-days", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch windows past the checkpoint watermark and append new jobs",
+    )
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Query each window once with the full format and sacct-side filters",
+    )
+    parser.add_argument(
+        "--qos",
+        default=None,
+        help="Comma-separated realtime QOS names to filter in sacct (--single-pass)",
+    )
+    return parser.parse_args()
+
+
 # Main function to write job information to CSV
 def main():
-    start_date = "2021-01-01"
-    end_date = "2023-10-12"
+    args = parse_args()
+    output_file_path = args.output
+    checkpoint = Checkpoint(args.checkpoint or output_file_path + ".checkpoint.jsonl")
 
-    job_ids = get_all_job_ids(start_date, end_date)
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    output_file_path = os.path.join(script_directory, "/data/slurm_job_info.csv")
-
-    with open(output_file_path, "w", newline="") as csvfile:
-        fieldnames = [
-            "Job Name",
-            "Job ID",
-            "Timelimit",
-            "Elapsed",
-            "Submit",
-            "Start",
-            "End",
-            "ReqNodes",
-            "QOS",
-            "User",
-            "ExitCode",
-        ]
+    start_date = args.start_date
+    end_date = args.end_date or (
+        date.today().isoformat() if args.incremental else "2023-10-12"
+    )
+    incremental = args.incremental and checkpoint.watermark is not None
+    if incremental:
+        start_date = max(start_date, checkpoint.watermark)
 
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    if args.single_pass:
+        job_info_list = get_all_job_info_single_pass(
+            start_date,
+            end_date,
+            delta_days=args.delta_days,
+            max_workers=args.workers,
+            checkpoint=checkpoint,
+            qos=args.qos,
+        )
+        if incremental:
+            existing_job_ids = read_existing_job_ids(output_file_path)
+            job_info_list = [
+                job_info
+                for job_info in job_info_list
+                if job_info["Job ID"] not in existing_job_ids
+            ]
+        write_job_info(output_file_path, job_info_list, append=incremental)
+        return
 
-        writer.writeheader()
+    windows = date_windows(start_date, end_date, args.delta_days)
+    job_ids = get_all_job_ids(
+        start_date,
+        end_date,
+        delta_days=args.delta_days,
+        max_workers=args.workers,
+        checkpoint=checkpoint,
+    )
 
-        # Fetch job info in chunks to avoid overloading sacct
-        chunk_size = 100
-        for i in range(0, len(job_ids), chunk_size):
-            job_info_list = extract_multiple_job_info(job_ids[i : i + chunk_size])
-            for job_info in job_info_list:
-                writer.writerow(job_info)
+    if incremental:
+        # Only look up jobs that are not already in the CSV
+        existing_job_ids = read_existing_job_ids(output_file_path)
+        job_ids = [job_id for job_id in job_ids if job_id not in existing_job_ids]
+
+    # Fetch job info in chunks to avoid overloading sacct
+    job_info_list, unfinished = extract_all_job_info(
+        job_ids,
+        chunk_size=args.chunk_size,
+        max_workers=args.workers,
+        checkpoint=checkpoint,
+    )
+    write_job_info(output_file_path, job_info_list, append=incremental)
+    update_watermark(checkpoint, windows, unfinished)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
+import sys
 from pathlib import Path
 
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import cache_merged_job_info
+
 
 def read_and_append_size(filename, size):
     """Read a CSV file and append a 'size' column."""
@@ -45,6 +50,9 @@ def main():
     # Save the merged dataframe to a new CSV file
     merged_df.to_csv(data_directory / "merged_job_info.csv", index=False)
 
+    # Store the parsed columns so downstream stages don't re-parse the CSV
+    cache_merged_job_info(merged_df)
+
 
 if __name__ == "__main__":
     main()
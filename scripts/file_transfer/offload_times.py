@@ -1,31 +1,51 @@
-from datetime import datetime
+import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
-# Define the scan number ranges for each size
-start_and_end_scan_numbers = {
-    "128": {"start": 4858, "end": 4887},
-    "256": {"start": 4828, "end": 4857},
-    "512": {"start": 4798, "end": 4827},
-    "1024": {"start": 4768, "end": 4797},
-}
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from common.experiments import OFFLOAD_EXPERIMENTS, ExperimentIndex
 
-def calculate_offload_time(row):
-    # Parse the datetime strings for all four times and the last written time
-    times = [
-        datetime.fromisoformat(row[f"time{i}"].replace("Z", "+00:00")) for i in range(4)
-    ]
-    time_last_written = datetime.fromisoformat(
-        row["time_last_written"].replace("Z", "+00:00")
+RECEIVER_TIME_COLUMNS = ["time0", "time1", "time2", "time3"]
+
+# Times are written as 2023-10-16T15:30:41+00:00 (older files may end in Z)
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+PERCENTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def parse_times(column):
+    """Parse a column of UTC timestamps to naive datetime64 in one call."""
+    return (
+        pd.to_datetime(
+            column.str.replace("Z", "+00:00", regex=False),
+            format=TIME_FORMAT,
+            utc=True,
+        )
+        .dt.tz_localize(None)
+        .to_numpy()
     )
 
-    # Sort the times and select the earliest
-    earliest_time = min(times)
 
-    # Calculate the time difference in seconds
-    return (time_last_written - earliest_time).total_seconds()
+def calculate_offload_times(write_times_df):
+    """Seconds from the earliest receiver time to the last .data write, per scan."""
+    receiver_times = np.column_stack(
+        [parse_times(write_times_df[column]) for column in RECEIVER_TIME_COLUMNS]
+    )
+    earliest_time = receiver_times.min(axis=1)
+    time_last_written = parse_times(write_times_df["time_last_written"])
+    return (time_last_written - earliest_time) / np.timedelta64(1, "s")
+
+
+def offload_percentiles(per_scan_df):
+    """Count, mean, std, min, max and PERCENTILES of the offload time per size."""
+    grouped = per_scan_df.groupby("size", observed=False)["offload_time"]
+    stats = grouped.agg(["count", "mean", "std", "min", "max"])
+    percentiles = grouped.quantile(PERCENTILES).unstack()
+    percentiles.columns = [f"p{int(q * 100)}" for q in PERCENTILES]
+    return stats.join(percentiles).reset_index()
 
 
 def main():
@@ -34,34 +54,34 @@ def main():
     # Read the main job information file
     write_times_df = pd.read_csv(data_directory / "write_times.csv")
 
-    # Calculate the offload time for each row
-    write_times_df["offload_time"] = write_times_df.apply(
-        calculate_offload_time, axis=1
-    )
+    # Calculate the offload time for every scan at once
+    write_times_df["offload_time"] = calculate_offload_times(write_times_df)
 
-    # Initialize a list to store the average offload times
-    avg_offload_times_list = []
-
-    # Loop through each size and its corresponding scan number range
-    for size, scan_range in start_and_end_scan_numbers.items():
-        # Filter the DataFrame based on the scan number range
-        filtered_df = write_times_df[
-            (write_times_df["scan_number"] >= scan_range["start"])
-            & (write_times_df["scan_number"] <= scan_range["end"])
-        ]
-
-        # Calculate the average offload time for this size
-        avg_offload_time = filtered_df["offload_time"].mean()
-
-        # Append the result to the list
-        avg_offload_times_list.append({"size": size, "offload_time": avg_offload_time})
+    # Tag each scan with the size of the offload experiment it belongs to
+    write_times_df["size"] = ExperimentIndex(OFFLOAD_EXPERIMENTS).assign(
+        write_times_df["scan_number"]
+    )
 
-    # Convert the list to a DataFrame
-    avg_offload_times_df = pd.DataFrame(avg_offload_times_list)
+    # Average offload time per size, in the order of OFFLOAD_EXPERIMENTS
+    avg_offload_times_df = (
+        write_times_df.groupby("size", observed=False)["offload_time"]
+        .mean()
+        .reset_index()
+    )
 
     # Save the average offload times to a CSV file
     avg_offload_times_df.to_csv(data_directory / "ncem_offload_times.csv", index=False)
 
+    # Keep the per-scan times, so the compare stages can use the distribution,
+    # and publish per-size percentiles next to the means
+    per_scan_df = write_times_df.dropna(subset=["size"])[
+        ["scan_number", "size", "offload_time"]
+    ]
+    per_scan_df.to_csv(data_directory / "ncem_offload_times_per_scan.csv", index=False)
+    offload_percentiles(per_scan_df).to_csv(
+        data_directory / "ncem_offload_time_percentiles.csv", index=False
+    )
+
 
 if __name__ == "__main__":
     main()
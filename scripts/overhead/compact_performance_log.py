@@ -0,0 +1,114 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import SAVE_TIME_STATS_PATH, SAVE_TIMES_PATH
+from common.experiments import OVERHEAD_BLANK_SCANS, OVERHEAD_SCANS
+
+MEASURES = ["total_time", "count_time", "save_time"]
+
+
+def log_files(paths):
+    """The given files, with directories expanded to their performance logs."""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files += sorted(path.glob("performance_log*.jsonl"))
+        else:
+            files.append(path)
+    return files
+
+
+def read_records(path):
+    """{scan: [records]} of one log in order.
+
+    JSON-lines logs are written by count.py; a .json file is read as an
+    already compacted log (the old performance_log.json or save_times.json).
+    A line cut short by a job that died mid-write is skipped, and so are the
+    per-rank stage times that --log-shards writes for ranks other than 0
+    (the record of rank 0 has their summary).
+    """
+    if path.suffix == ".json":
+        with open(path, "r") as f:
+            return json.load(f)
+
+    records = {}
+    with open(path, "r") as f:
+        for number, line in enumerate(f, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"{path}:{number}: skipping incomplete record")
+                continue
+            if record.get("rank", 0) != 0:
+                continue
+            records.setdefault(record.pop("scan"), []).append(record)
+    return records
+
+
+def compact(paths):
+    """{scan: [records]} of all the logs, with the scans sorted."""
+    merged = {}
+    for path in log_files(paths):
+        for scan, records in read_records(path).items():
+            merged.setdefault(scan, []).extend(records)
+    return {scan: merged[scan] for scan in sorted(merged)}
+
+
+def save_time_statistics(performance):
+    """Mean and std of each measure by size and type (Real or Blank)."""
+    df = pd.DataFrame(
+        [
+            {"scan_id": scan, **record}
+            for scan, records in performance.items()
+            for record in records
+        ]
+    )
+    rows = []
+    for size, scans in OVERHEAD_SCANS.items():
+        for type_key in ["Real", "Blank"]:
+            chosen = [
+                scan
+                for scan in scans
+                if (scan in OVERHEAD_BLANK_SCANS) == (type_key == "Blank")
+            ]
+            subset = df[df["scan_id"].isin(chosen)]
+            for stat in ["mean", "std"]:
+                row = {"Size": int(size), "Type": type_key, "Stat": stat}
+                for measure in MEASURES:
+                    row[measure] = getattr(subset[measure], stat)()
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge the performance logs of count.py into save_times.json "
+        "and save_time_stats.csv."
+    )
+    parser.add_argument(
+        "logs",
+        nargs="+",
+        help="performance_log*.jsonl files, directories holding them, or "
+        "compacted .json logs",
+    )
+    parser.add_argument("--json", default=str(SAVE_TIMES_PATH))
+    parser.add_argument("--stats", default=str(SAVE_TIME_STATS_PATH))
+    args = parser.parse_args()
+
+    performance = compact(args.logs)
+    with open(args.json, "w") as f:
+        json.dump(performance, f, indent=4)
+
+    stats = save_time_statistics(performance)
+    stats.to_csv(args.stats, index=False)
+    print(stats.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -32,12 +32,41 @@ parser.add_argument(
 parser.add_argument(
     "--timestamp", "-i", type=str, default=datetime.now().isoformat()
 )  # New argument for timestamp
+parser.add_argument(
+    "--manifest", "-f", type=str, default=None
+)  # CSV of scan_number,distiller_id[,location] jobs, counted one after another
+parser.add_argument(
+    "--runs", "-n", type=int, default=1
+)  # Times each manifest job is counted
+parser.add_argument(
+    "--log-shards", dest="log_shards", action="store_true"
+)  # One performance log per job and rank
+parser.add_argument(
+    "--sync-save", dest="sync_save", action="store_true"
+)  # With --manifest, save each scan before counting the next
+parser.add_argument(
+    "--save-queue", dest="save_queue", type=int, default=1
+)  # With --manifest, counted scans that may wait for the writer
+parser.add_argument(
+    "--no-spans", dest="spans", action="store_false"
+)  # Skip the per-rank stage timings
 args = parser.parse_args()
+if args.manifest is None and (args.scan_number is None or args.distiller_id is None):
+    parser.error("--scan_number and --distiller_id are required without --manifest")
+if args.save_queue < 1:
+    # queue.Queue treats a size of 0 or less as unbounded
+    parser.error("--save-queue must be at least 1")
 
+import csv
 import json
+import statistics
 import os
+import queue
 import sys
+import threading
 import time
+import traceback
+from contextlib import contextmanager
 from pathlib import Path
 from uuid import uuid4
 
@@ -51,10 +80,7 @@ comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
 
 # Inputs
-scanNum = args.scan_number
-distiller_id = args.distiller_id
 th = float(args.threshold)
-drive = Path(args.location)
 num_threads = args.num_threads
 image = args.image
 pad = args.pad  # pad scan num with zeros
@@ -69,82 +95,515 @@ dark0 = np.zeros((576, 576))
 # Empty gain
 gain0 = None
 
-# Format and parse the timestamp
-timestamp = datetime.fromisoformat(args.timestamp)
-timestamp_local = timestamp.astimezone(tz.gettz("US/Pacific"))
-formatted_timestamp = timestamp_local.strftime("%y%m%d_%H%M")
+# Threshold calculation input
+number_of_samples = 1200
+threshold_num_blocks = 20
+xray_threshold_n_sigma = 175
 
-# Setup file name and path
-if pad:
-    scanName = "data_scan{:010}_*.data".format(scanNum)
-else:
-    scanName = "data_scan{}_*.data".format(scanNum)
 
-print("Using files in {}".format(drive))
-print("scan name = {}".format(scanName))
+def format_timestamp(isoformat):
+    timestamp = datetime.fromisoformat(isoformat)
+    timestamp_local = timestamp.astimezone(tz.gettz("US/Pacific"))
+    return timestamp_local.strftime("%y%m%d_%H%M")
 
-files = drive.glob(scanName)
-iFiles = [str(f) for f in files]
 
-iFiles = sorted(iFiles)
+def read_manifest(path, location):
+    """(scan_number, distiller_id, location) of each row of a manifest CSV.
 
-# Electron count the data
-sReader = stio.reader(iFiles, stio.FileVersion.VERSION5, backend="multi-pass")
+    The location column is optional and defaults to --location.
+    """
+    with open(path, newline="") as f:
+        return [
+            (
+                int(row["scan_number"]),
+                int(row["distiller_id"]),
+                row.get("location") or location,
+            )
+            for row in csv.DictReader(f)
+        ]
 
 
-print("start counting #{}".format(scanNum))
-t0 = time.time()
-electron_counted_data = stim.electron_count(
-    sReader,
-    dark0,
-    gain=gain0,
-    number_of_samples=1200,
-    verbose=True,
-    threshold_num_blocks=20,
-    xray_threshold_n_sigma=175,
-    background_threshold_n_sigma=th,
-    apply_row_dark=apply_row_dark_subtraction,
-    apply_row_dark_use_mean=apply_row_dark_use_mean,
-)
-t1 = time.time()
+class Spans:
+    """Wall-clock time of nested stages on one rank, as {"scan/count": seconds}.
+
+    Each span costs two perf_counter calls; with enabled=False nothing is
+    recorded and gather() returns None without communicating. The times of
+    this rank before the last gather() are kept in last_times.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.stack = []
+        self.times = {}
+        self.last_times = {}
+
+    @contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+        self.stack.append(name)
+        path = "/".join(self.stack)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[path] = self.times.get(path, 0.0) + time.perf_counter() - t0
+            self.stack.pop()
+
+    def gather(self):
+        """Min, median and max of each stage over the ranks, on rank 0.
+
+        The imbalance is the slowest rank over the mean of the ranks that ran
+        the stage (1 when balanced). Every rank must call this, and the
+        spans start over afterwards.
+        """
+        if not self.enabled:
+            return None
+        all_times = comm.gather(self.times, root=0)
+        self.last_times, self.times = self.times, {}
+        if rank != 0:
+            return None
+
+        summary = {}
+        for path in sorted({path for times in all_times for path in times}):
+            by_rank = {
+                r: times[path] for r, times in enumerate(all_times) if path in times
+            }
+            values = list(by_rank.values())
+            slowest = max(by_rank, key=by_rank.get)
+            mean = sum(values) / len(values)
+            summary[path] = {
+                "min": min(values),
+                "median": statistics.median(values),
+                "max": max(values),
+                "imbalance": max(values) / mean if mean else 1.0,
+                "slowest_rank": slowest,
+            }
+        return summary
+
+
+def print_spans(scanNum, summary):
+    for path, stage in summary.items():
+        print(
+            "scan #{} {}: min {:.3f} s, median {:.3f} s, max {:.3f} s "
+            "(rank {}), imbalance {:.2f}".format(
+                scanNum,
+                path,
+                stage["min"],
+                stage["median"],
+                stage["max"],
+                stage["slowest_rank"],
+                stage["imbalance"],
+            )
+        )
 
-distiller_id = f"{distiller_id:05}"
-scanNum = f"{scanNum:05}"
 
-if rank == 0:
-    count_time = t1 - t0
-    # as H5 file
+spans = Spans(args.spans)
+
+
+def count_scan(scanNum, drive):
+    """Count one scan on every rank.
+
+    Returns (electron_counted_data, count_time) on rank 0 and None elsewhere,
+    or on every rank if the scan has no files.
+    """
+    # Setup file name and path
+    if pad:
+        scanName = "data_scan{:010}_*.data".format(scanNum)
+    else:
+        scanName = "data_scan{}_*.data".format(scanNum)
+
+    print("Using files in {}".format(drive))
+    print("scan name = {}".format(scanName))
+
+    with spans.span("glob"):
+        files = drive.glob(scanName)
+        iFiles = [str(f) for f in files]
+
+        iFiles = sorted(iFiles)
+    if not iFiles:
+        # Every rank sees the same files, so all of them skip the scan
+        print("no files for scan #{}, skipping".format(scanNum))
+        return None
+
+    # Electron count the data
+    with spans.span("reader"):
+        sReader = stio.reader(iFiles, stio.FileVersion.VERSION5, backend="multi-pass")
+
+    print("start counting #{}".format(scanNum))
+    t0 = time.time()
+    # Sampling the thresholds and gathering the counts to rank 0 happen inside
+    # electron_count, in one call into stempy with the multi-pass reader, so
+    # they cannot be timed apart and their time is part of this span
+    with spans.span("count"):
+        electron_counted_data = stim.electron_count(
+            sReader,
+            dark0,
+            gain=gain0,
+            number_of_samples=number_of_samples,
+            verbose=True,
+            threshold_num_blocks=threshold_num_blocks,
+            xray_threshold_n_sigma=xray_threshold_n_sigma,
+            background_threshold_n_sigma=th,
+            apply_row_dark=apply_row_dark_subtraction,
+            apply_row_dark_use_mean=apply_row_dark_use_mean,
+        )
+    t1 = time.time()
+
+    if rank != 0:
+        return None
+    return electron_counted_data, t1 - t0
+
+
+def save_scan(electron_counted_data, scanNum, distiller_id, drive, formatted_timestamp):
+    """Write the counts of a scan as an H5 file in drive; returns the save time."""
     outPath = drive / Path(
-        f"FOURD_{formatted_timestamp}_{distiller_id}_{scanNum}_{uuid4()}.h5"
+        f"FOURD_{formatted_timestamp}_{distiller_id:05}_{scanNum:05}_{uuid4()}.h5"
     )
     t0 = time.time()
     stio.save_electron_counts(outPath, electron_counted_data)
     t1 = time.time()
-    save_time = t1 - t0
     print(outPath)
+    return t1 - t0
+
+
+def log_performance(drive, scanNum, performance_data):
+    """Append the record of a scan to the JSON-lines log beside drive.
 
-    toc = time.time()
-    total_time = toc - tic
-
-    # Log performance data to JSON
-    performance_data = {
-        "timestamp": formatted_timestamp,
-        "count_time": count_time,
-        "total_time": total_time,
-        "save_time": save_time,
-        "image": image,
-    }
-
-    json_path = drive / ".." / "performance_log.json"
-    if json_path.exists():
-        with open(json_path, "r") as f:
-            current_data = json.load(f)
+    Each record is one os.write on an O_APPEND descriptor, so concurrent
+    jobs never overwrite or interleave each other's records. With
+    --log-shards every rank of every job writes its own file (see
+    log_rank_spans).
+    """
+    if args.log_shards:
+        job = os.environ.get("SLURM_JOB_ID", os.getpid())
+        name = "performance_log.{}.{}.jsonl".format(job, rank)
     else:
-        current_data = {}
+        name = "performance_log.jsonl"
+    record = {"scan": f"{scanNum:05}", **performance_data}
+    line = (json.dumps(record) + "\n").encode()
+
+    fd = os.open(drive / ".." / name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        written = os.write(fd, line)
+    finally:
+        os.close(fd)
+    if written != len(line):
+        raise OSError("short write of the record of scan #{}".format(scanNum))
+
+
+def log_rank_spans(drive, scanNum, timestamp):
+    """With --log-shards, log the stage times of this rank to its own shard.
+
+    Rank 0 logs the scan record, which has the summary over the ranks; every
+    other rank logs its own seconds per stage. Needs the spans.
+    """
+    if not args.log_shards or not spans.enabled or rank == 0:
+        return
+    log_performance(
+        drive,
+        scanNum,
+        {"rank": rank, "timestamp": timestamp, "spans": spans.last_times},
+    )
+
+
+def report(drive, scanNum, performance_data, stage_times):
+    """Log and print the record of a scan, with its spans if any."""
+    if stage_times is not None:
+        performance_data["spans"] = stage_times
+    log_performance(drive, scanNum, performance_data)
+    print(
+        "scan #{}: count {:.2f} s, save {:.2f} s, total {:.2f} s".format(
+            scanNum,
+            performance_data["count_time"],
+            performance_data["save_time"],
+            performance_data["total_time"],
+        )
+    )
+    if stage_times is not None:
+        print_spans(scanNum, stage_times)
+
+
+class BackgroundWriter:
+    """Saves and logs counted scans on a thread of rank 0.
+
+    The ranks go on to count the next scan while a scan is written. At most
+    queue_size counted scans wait for the writer, on top of the one being
+    written, so put() blocks rather than letting memory grow. The time each
+    save overlapped with counting, and each count with a save, is added to
+    the performance records.
+
+    Overlap alone does not tell whether it paid off: the save and the count
+    share the nodes of rank 0. close() compares the counts and saves that
+    overlapped with those that ran alone, which gives the slowdown of both.
+    """
+
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        # [start, end] of each count and save; end is None while running
+        self.counting = []
+        self.saving = []
+        self.lock = threading.Lock()
+        # (seconds, overlapped) of each count and save
+        self.counts = []
+        self.saves = []
+        self.overlap_time = 0.0
+        self.blocked_time = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start_counting(self):
+        with self.lock:
+            self.counting.append([time.time(), None])
+
+    def stop_counting(self):
+        """End the current count; returns the seconds a save ran during it."""
+        end = time.time()
+        with self.lock:
+            self.counting[-1][1] = end
+        return self.overlap(self.saving, self.counting[-1][0], end)
+
+    def overlap(self, intervals, start, end):
+        """Seconds of [start, end] covered by intervals (open ones up to end)."""
+        with self.lock:
+            return sum(
+                max(0.0, min(end, interval_end or end) - max(start, interval_start))
+                for interval_start, interval_end in intervals
+            )
+
+    def put(
+        self,
+        electron_counted_data,
+        scanNum,
+        distiller_id,
+        drive,
+        timestamp,
+        count_time,
+        tic,
+        stage_times,
+        count_overlap_time,
+    ):
+        self.counts.append((count_time, count_overlap_time > 0))
+        t0 = time.time()
+        self.queue.put(
+            (
+                electron_counted_data,
+                scanNum,
+                distiller_id,
+                drive,
+                timestamp,
+                count_time,
+                tic,
+                stage_times,
+                count_overlap_time,
+                t0,
+            )
+        )
+        self.blocked_time += time.time() - t0
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self.write(*job)
+            except Exception:
+                # The other ranks would wait for rank 0 in the next count
+                traceback.print_exc()
+                comm.Abort(1)
+
+    def write(
+        self,
+        electron_counted_data,
+        scanNum,
+        distiller_id,
+        drive,
+        timestamp,
+        count_time,
+        tic,
+        stage_times,
+        count_overlap_time,
+        queued,
+    ):
+        save_start = time.time()
+        with self.lock:
+            self.saving.append([save_start, None])
+        save_time = save_scan(
+            electron_counted_data, scanNum, distiller_id, drive, timestamp
+        )
+        save_end = time.time()
+        with self.lock:
+            self.saving[-1][1] = save_end
+        overlap_time = self.overlap(self.counting, save_start, save_end)
+
+        # The total runs until the counts are on disk, so it includes the wait
+        # for the writer and may overlap with the next scan
+        performance_data = {
+            "timestamp": timestamp,
+            "count_time": count_time,
+            "total_time": save_end - tic,
+            "save_time": save_time,
+            "image": image,
+            "queue_wait": save_start - queued,
+            "overlap_time": overlap_time,
+            "count_overlap_time": count_overlap_time,
+        }
+        report(drive, scanNum, performance_data, stage_times)
+
+        self.saves.append((save_time, overlap_time > 0))
+        self.overlap_time += overlap_time
+
+    def close(self):
+        """Wait for the queued saves and print the overlap achieved and what it
+        cost the counts and saves that overlapped."""
+        t0 = time.time()
+        self.queue.put(None)
+        self.thread.join()
+        self.blocked_time += time.time() - t0
+        save_time = sum(seconds for seconds, _ in self.saves)
+        print(
+            "{} saves: {:.2f} s writing, {:.2f} s ({:.0%}) overlapped with "
+            "counting, {:.2f} s waiting for the writer".format(
+                len(self.saves),
+                save_time,
+                self.overlap_time,
+                self.overlap_time / save_time if save_time else 0.0,
+                self.blocked_time,
+            )
+        )
+        for name, times in [("count", self.counts), ("save", self.saves)]:
+            overlapped = [seconds for seconds, shared in times if shared]
+            alone = [seconds for seconds, shared in times if not shared]
+            if not overlapped or not alone:
+                print(
+                    "{} slowdown: not measured ({} overlapped, {} alone)".format(
+                        name, len(overlapped), len(alone)
+                    )
+                )
+                continue
+            mean_overlapped = statistics.mean(overlapped)
+            mean_alone = statistics.mean(alone)
+            print(
+                "{} slowdown: mean {:.2f} s overlapped ({}) vs {:.2f} s alone "
+                "({}), x{:.2f}".format(
+                    name,
+                    mean_overlapped,
+                    len(overlapped),
+                    mean_alone,
+                    len(alone),
+                    mean_overlapped / mean_alone,
+                )
+            )
+
+
+if args.manifest is None:
+    # One scan per launch, timed from the start of the script
+    drive = Path(args.location)
+    formatted_timestamp = format_timestamp(args.timestamp)
+    with spans.span("scan"):
+        counted = count_scan(args.scan_number, drive)
+        if counted is not None:
+            electron_counted_data, count_time = counted
+            with spans.span("save"):
+                save_time = save_scan(
+                    electron_counted_data,
+                    args.scan_number,
+                    args.distiller_id,
+                    drive,
+                    formatted_timestamp,
+                )
+    stage_times = spans.gather()
+    log_rank_spans(drive, args.scan_number, formatted_timestamp)
+
+    if counted is not None:
+        toc = time.time()
+        total_time = toc - tic
+
+        # Log performance data to JSON
+        performance_data = {
+            "timestamp": formatted_timestamp,
+            "count_time": count_time,
+            "total_time": total_time,
+            "save_time": save_time,
+            "image": image,
+        }
+        report(drive, args.scan_number, performance_data, stage_times)
+else:
+    # Worker mode: MPI and the imports above are set up once for all the jobs,
+    # and every scan is timed from its own start
+    jobs = None
+    if rank == 0:
+        jobs = [
+            job
+            for job in read_manifest(args.manifest, args.location)
+            for _ in range(args.runs)
+        ]
+        print("{} jobs from {}".format(len(jobs), args.manifest))
+    jobs = comm.bcast(jobs, root=0)
+
+    # Saves of rank 0 overlap with the counting of the next scan on all ranks
+    writer = None
+    if rank == 0 and not args.sync_save:
+        writer = BackgroundWriter(args.save_queue)
+
+    for i, (scanNum, distiller_id, location) in enumerate(jobs):
+        # Ranks agree on the start time so the file names match
+        scan_tic = comm.bcast(time.time() if rank == 0 else None, root=0)
+        formatted_timestamp = format_timestamp(
+            datetime.fromtimestamp(scan_tic).isoformat()
+        )
+        print("job {} of {}: scan #{}".format(i + 1, len(jobs), scanNum))
+        drive = Path(location)
+
+        with spans.span("scan"):
+            if writer is not None:
+                writer.start_counting()
+            counted = count_scan(scanNum, drive)
+            if writer is not None:
+                count_overlap_time = writer.stop_counting()
+            if counted is not None and writer is None:
+                electron_counted_data, count_time = counted
+                with spans.span("save"):
+                    save_time = save_scan(
+                        electron_counted_data,
+                        scanNum,
+                        distiller_id,
+                        drive,
+                        formatted_timestamp,
+                    )
+        # Every rank takes part, including those without counts
+        stage_times = spans.gather()
+        log_rank_spans(drive, scanNum, formatted_timestamp)
+        if counted is None:
+            continue
+
+        if writer is not None:
+            electron_counted_data, count_time = counted
+            writer.put(
+                electron_counted_data,
+                scanNum,
+                distiller_id,
+                drive,
+                formatted_timestamp,
+                count_time,
+                scan_tic,
+                stage_times,
+                count_overlap_time,
+            )
+            continue
 
-    if scanNum not in current_data:
-        current_data[scanNum] = []
-    current_data[scanNum].append(performance_data)
+        performance_data = {
+            "timestamp": formatted_timestamp,
+            "count_time": count_time,
+            "total_time": time.time() - scan_tic,
+            "save_time": save_time,
+            "image": image,
+        }
+        report(drive, scanNum, performance_data, stage_times)
 
-    with open(json_path, "w") as f:
-        json.dump(current_data, f, indent=4)
+    if writer is not None:
+        writer.close()
+    if rank == 0:
+        print("{} jobs in {:.2f} s".format(len(jobs), time.time() - tic))
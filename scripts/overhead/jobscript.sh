@@ -39,16 +39,43 @@ run_scans() {
     done
 }
 
-DATA_DIR="/pscratch/sd/s/swelborn/test-stempy-overhead/test-real-data"
+add_scans() {
+    local start_scan=$1
+    local end_scan=$2
+    local start_distiller=$3
+    local data_dir=$4
+    local manifest=$5
+
+    for (( scan=start_scan; scan<=end_scan; scan++ )); do
+        echo "$scan,$((start_distiller + scan - start_scan)),$data_dir" >> $manifest
+    done
+}
+
+REAL_DATA_DIR="/pscratch/sd/s/swelborn/test-stempy-overhead/test-real-data"
+BLANK_DATA_DIR="/pscratch/sd/s/swelborn/test-stempy-overhead/test-blank-data"
 IMAGE="stempy-mpi-3.3.14"
 NUM_RUNS=5
 
+# One launch counts every scan (set PER_SCAN_LAUNCH=1 to launch once per run)
+if [ -z "$PER_SCAN_LAUNCH" ]; then
+    MANIFEST="manifest-$SLURM_JOB_ID.csv"
+    echo "scan_number,distiller_id,location" > $MANIFEST
+    # First batch of real data
+    add_scans 14 25 16075 $REAL_DATA_DIR $MANIFEST
+    # Second batch of real data (discontinuity in distiller IDs)
+    add_scans 26 29 16091 $REAL_DATA_DIR $MANIFEST
+    # Blank data
+    add_scans 93 96 16162 $BLANK_DATA_DIR $MANIFEST
+
+    srun --exclusive -c 128 -n 4 shifter python3 /pscratch/sd/s/swelborn/test-stempy-overhead/count.py --pad -t 4.5 -f $MANIFEST -n $NUM_RUNS -z $IMAGE --multi-pass || error_exit "Error shifter execution failed."
+    exit
+fi
+
 # First batch of real data
-run_scans 14 25 16075 $DATA_DIR $IMAGE $NUM_RUNS
+run_scans 14 25 16075 $REAL_DATA_DIR $IMAGE $NUM_RUNS
 
 # Second batch of real data (discontinuity in distiller IDs)
-run_scans 26 29 16091 $DATA_DIR $IMAGE $NUM_RUNS
+run_scans 26 29 16091 $REAL_DATA_DIR $IMAGE $NUM_RUNS
 
 # Blank data
-DATA_DIR="/pscratch/sd/s/swelborn/test-stempy-overhead/test-blank-data"
-run_scans 93 96 16162 $DATA_DIR $IMAGE $NUM_RUNS
\ No newline at end of file
+run_scans 93 96 16162 $BLANK_DATA_DIR $IMAGE $NUM_RUNS
@@ -1,4 +1,5 @@
-from os import remove
+import sys
+from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -6,6 +7,11 @@ import pandas as pd
 import seaborn as sns
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import load_merged_job_info
+from common.rendering import figure_dpi, render_figures
+
 
 def remove_outliers(data):
     """Remove outliers based on IQR."""
@@ -20,46 +26,40 @@ plt.rcParams["font.family"] = "Georgia Pro"
 
 def read_and_prepare_data():
     """Read and prepare data for plotting scatter plots and box plots."""
-    df = pd.read_csv("/streaming_analysis/data/file_transfer/merged_job_info.csv")
-    df["Submit"] = pd.to_datetime(df["Submit"])
-    df["Start"] = pd.to_datetime(df["Start"])
+    df = load_merged_job_info()
     df["queue_time"] = (df["Start"] - df["Submit"]).dt.total_seconds()
     df = df.dropna(subset=["queue_time"])
     return df
 
 
-def plot_scatter(df, column, xlabel, filename):
-    """Plot a scatter plot for a given column."""
+def plot_scatter(values, xlabel, filename):
+    """Plot a scatter plot of values against their index."""
     sns.set_style("ticks")
     sns.scatterplot(
-        x=range(len(df)), color="#0762CF", edgecolor="black", y=df[column], s=5
+        x=range(len(values)), color="#0762CF", edgecolor="black", y=values, s=5
     )
     plt.xlabel("Index")
     plt.ylabel(xlabel)
 
-    _, upper_bound = df[column].quantile([0, 0.90])
+    upper_bound = np.quantile(values, 0.90)
     plt.ylim(-5, upper_bound)
 
-    plt.savefig(filename, dpi=600)
+    plt.savefig(filename, dpi=figure_dpi())
     plt.close()
 
 
-def plot_histogram(df, xlabel, filename, bin_range, num_bins):
-    """Plot a histogram for a given size and column."""
+def plot_histogram(values, xlabel, filename, bin_range, num_bins):
+    """Plot a histogram of values with outliers already removed."""
     # Define font sizes
     label_font_size = 8
     tick_font_size = 6
-    df["Submit"] = pd.to_datetime(df["Submit"])
-    df["Start"] = pd.to_datetime(df["Start"])
-    df["queue_time"] = (df["Start"] - df["Submit"]).dt.total_seconds()
-    df["queue_time"] = remove_outliers(df["queue_time"])
 
     sns.set_style("ticks")
     plt.figure(figsize=(3, 2))
 
     # Main plot
     ax_main = sns.histplot(
-        df["queue_time"],
+        values,
         bins=num_bins,
         binrange=bin_range,
         kde=False,
@@ -78,7 +78,7 @@ def plot_histogram(df, xlabel, filename, bin_range, num_bins):
     # Inset plot
     ax_inset = inset_axes(ax_main, width="40%", height="40%", borderpad=1)
     sns.histplot(
-        df["queue_time"],
+        values,
         bins=num_bins,
         binrange=bin_range,
         kde=False,
@@ -87,8 +87,6 @@ def plot_histogram(df, xlabel, filename, bin_range, num_bins):
         stat="probability",
         ax=ax_inset,
     )
-    print(f'Average queue time: {df["queue_time"].mean()}')
-    print(f'Standard deviation queue time: {df["queue_time"].std()}')
     ax_inset.set_xlim(-5, bin_range[1])
     ax_inset.set_ylim(0, 0.5)
 
@@ -106,50 +104,65 @@ def plot_histogram(df, xlabel, filename, bin_range, num_bins):
     # Adjust layout to make sure everything fits
     plt.tight_layout()
 
-    plt.savefig(filename, dpi=600)  # Increase dpi to 600 for higher resolution
+    plt.savefig(filename, dpi=figure_dpi())  # 600 dpi unless previewing
     plt.close()
 
 
-def plot_scatter_by_date(df, column, xlabel, filename):
-    """Plot a scatter plot organized by submission date."""
+def plot_scatter_by_date(submit, values, xlabel, filename):
+    """Plot a scatter plot of values against their (sorted) submission date."""
     sns.set_style("ticks")
 
-    # Sort the DataFrame by the 'Submit' column
-    df = df.sort_values(by="Submit")
-
-    sns.scatterplot(
-        x="Submit", y=column, color="#0762CF", edgecolor="black", data=df, s=5
-    )
+    sns.scatterplot(x=submit, y=values, color="#0762CF", edgecolor="black", s=5)
     plt.xlabel("Submission Date")
     plt.ylabel(xlabel)
     plt.xticks(rotation=45)
-    _, upper_bound = df[column].quantile([0, 0.90])
+    upper_bound = np.quantile(values, 0.90)
     plt.ylim(-5, upper_bound)
 
-    plt.savefig(filename, dpi=600)
+    plt.savefig(filename, dpi=figure_dpi())
     plt.close()
 
 
 def main():
     df = read_and_prepare_data()
-    plot_scatter(
-        df,
-        "queue_time",
-        "Queue Time (s)",
-        "/streaming_analysis/plots/queue_time_scatter.png",
-    )
-    plot_scatter_by_date(
-        df,
-        "queue_time",
-        "Queue Time (s)",
-        "/streaming_analysis/plots/queue_time_scatter_by_date.png",
-    )
-    plot_histogram(
-        df,
-        "Queue time (s)",
-        "/streaming_analysis/plots/queue_time_hist.png",
-        (0, 100),
-        100,
+
+    # The figures are independent; send each one only the arrays it draws
+    queue_time = df["queue_time"].to_numpy()
+    by_date = df.sort_values(by="Submit")
+    filtered_queue_time = remove_outliers(df["queue_time"]).to_numpy()
+    print(f"Average queue time: {filtered_queue_time.mean()}")
+    print(f"Standard deviation queue time: {filtered_queue_time.std(ddof=1)}")
+
+    render_figures(
+        [
+            (
+                plot_scatter,
+                (
+                    queue_time,
+                    "Queue Time (s)",
+                    "/streaming_analysis/plots/queue_time_scatter.png",
+                ),
+            ),
+            (
+                plot_scatter_by_date,
+                (
+                    by_date["Submit"].to_numpy(),
+                    by_date["queue_time"].to_numpy(),
+                    "Queue Time (s)",
+                    "/streaming_analysis/plots/queue_time_scatter_by_date.png",
+                ),
+            ),
+            (
+                plot_histogram,
+                (
+                    filtered_queue_time,
+                    "Queue time (s)",
+                    "/streaming_analysis/plots/queue_time_hist.png",
+                    (0, 100),
+                    100,
+                ),
+            ),
+        ]
     )
 
 
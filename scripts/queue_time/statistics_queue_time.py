@@ -1,57 +1,52 @@
-import pandas as pd
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import load_merged_job_info, load_queue_time_rollup
+from common.rollup import query_rollup
+from common.sketches import describe, iqr_mask
 
 
 def calculate_and_write_stats(df, column, filename, section_title):
-    """Calculate basic statistics and write to a file."""
-    mean_time = df[column].mean()
-    median_time = df[column].median()
-    std_dev_time = df[column].std()
-    min_time = df[column].min()
-    max_time = df[column].max()
-    quantile_25 = df[column].quantile(0.25)
-    quantile_75 = df[column].quantile(0.75)
+    """Calculate basic statistics, write them to a file and return them."""
+    stats = describe(df[column])
 
     stats_str = f"""{section_title}
-Mean time: {mean_time} seconds
-Median time: {median_time} seconds
-Standard Deviation: {std_dev_time} seconds
-Minimum time: {min_time} seconds
-Maximum time: {max_time} seconds
-25th percentile: {quantile_25} seconds
-75th percentile: {quantile_75} seconds
+Mean time: {stats["mean"]} seconds
+Median time: {stats["median"]} seconds
+Standard Deviation: {stats["std"]} seconds
+Minimum time: {stats["min"]} seconds
+Maximum time: {stats["max"]} seconds
+25th percentile: {stats["q25"]} seconds
+75th percentile: {stats["q75"]} seconds
 --------------------------------------------\n"""
 
-    with open(filename, "a") as f:
+    with open(filename, "w") as f:
         f.write(stats_str)
+    return stats
 
 
 def main():
     # Read the merged job information file
-    df = pd.read_csv("/streaming_analysis/data/file_transfer/merged_job_info.csv")
+    df = load_merged_job_info()
 
     # Calculate time between "Submit" and "Start" time
-    df["Submit"] = pd.to_datetime(df["Submit"])
-    df["Start"] = pd.to_datetime(df["Start"])
     df["queue_time"] = (df["Start"] - df["Submit"]).dt.total_seconds()
 
     # Remove NaN values for accurate statistics
     df = df.dropna(subset=["queue_time"])
 
     # Calculate and write statistics with outliers
-    calculate_and_write_stats(
+    stats = calculate_and_write_stats(
         df,
         "queue_time",
         "/streaming_analysis/data/outputs/queue_time_statistics_with_outliers.txt",
         "Statistics with Outliers",
     )
 
-    # Remove outliers based on IQR
-    Q1 = df["queue_time"].quantile(0.25)
-    Q3 = df["queue_time"].quantile(0.75)
-    IQR = Q3 - Q1
-    df_filtered = df[
-        ~((df["queue_time"] < (Q1 - 1.5 * IQR)) | (df["queue_time"] > (Q3 + 1.5 * IQR)))
-    ]
+    # Remove outliers based on IQR, reusing the quartiles computed above
+    df_filtered = df[iqr_mask(df["queue_time"], stats["q25"], stats["q75"])]
 
     # Calculate and write statistics without outliers
     calculate_and_write_stats(
@@ -61,6 +56,14 @@ def main():
         "Statistics without Outliers",
     )
 
+    # Per-month summaries, merged from the hourly cells of the queue time cube
+    monthly = query_rollup(*load_queue_time_rollup(), ["month"])
+    monthly.insert(0, "series", "queue_time")
+    monthly.to_csv(
+        "/streaming_analysis/data/outputs/queue_time_statistics_by_month.csv",
+        index=False,
+    )
+
 
 if __name__ == "__main__":
     main()
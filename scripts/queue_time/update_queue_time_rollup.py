@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import load_queue_time_rollup
+from common.rollup import query_rollup
+
+
+def main():
+    # Hourly cells of the queue time (Submit to Start) per QOS and size; only
+    # jobs that are not in the cube yet are aggregated
+    cells, digests = load_queue_time_rollup()
+
+    query_rollup(cells, digests, ["month", "qos", "size"]).to_csv(
+        "/streaming_analysis/data/outputs/queue_time_rollup_by_month.csv",
+        index=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
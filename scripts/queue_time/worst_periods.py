@@ -0,0 +1,284 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.datasets import load_merged_job_info
+
+WINDOWS = ["1h", "3h", "6h"]
+METRICS = ["mean", "p95", "max"]
+
+# Windows with fewer jobs are not ranked, since one slow job would dominate
+MIN_JOBS = 5
+TOP_WINDOWS = 10
+
+# Change points closer than this many jobs, or this long, to each other are
+# not searched for. Jobs come in sessions of a few hours, so a regime must
+# outlast a session to count as sustained
+MIN_SEGMENT_JOBS = 20
+MIN_SEGMENT_DURATION = "7D"
+
+
+class RankCounter:
+    """Fenwick tree over value ranks, for the k-th smallest value in a window."""
+
+    def __init__(self, n):
+        self.n = n
+        self.tree = np.zeros(n + 1, dtype=np.int64)
+        self.top = 1 << n.bit_length()
+
+    def add(self, rank, count):
+        i = rank + 1
+        while i <= self.n:
+            self.tree[i] += count
+            i += i & -i
+
+    def kth(self, k):
+        """Rank of the k-th smallest value present (k starts at 1)."""
+        position = 0
+        step = self.top
+        while step:
+            following = position + step
+            if following <= self.n and self.tree[following] < k:
+                position = following
+                k -= self.tree[following]
+            step >>= 1
+        return position
+
+
+def window_ends(times, length):
+    """Index one past the last job of the window starting at each job."""
+    return np.searchsorted(times, times + length, side="left")
+
+
+def window_means(values, starts, ends):
+    prefix = np.r_[0.0, np.cumsum(values)]
+    return (prefix[ends] - prefix[starts]) / (ends - starts)
+
+
+def window_maxima(values, starts, ends):
+    """Max over each [start, end) from a sparse table, in O(n log n)."""
+    table = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = table[-1]
+        table.append(np.maximum(previous[:-width], previous[width:]))
+        width *= 2
+    level = np.floor(np.log2(ends - starts)).astype(int)
+    maxima = np.empty(len(starts))
+    for k in np.unique(level):
+        chosen = level == k
+        left = table[k][starts[chosen]]
+        right = table[k][ends[chosen] - (1 << k)]
+        maxima[chosen] = np.maximum(left, right)
+    return maxima
+
+
+def window_percentiles(values, starts, ends, q=0.95):
+    """Nearest-rank q-quantile of each window, sliding with two pointers.
+
+    Every job enters and leaves the rank counter once, so the cost is
+    O(n log n) over all windows.
+    """
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(len(values))
+    sorted_values = values[order]
+
+    counter = RankCounter(len(values))
+    percentiles = np.empty(len(starts))
+    inside_end = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        while inside_end < end:
+            counter.add(ranks[inside_end], 1)
+            inside_end += 1
+        if i > 0:
+            counter.add(ranks[starts[i - 1]], -1)
+        k = int(np.ceil(q * (end - start)))
+        percentiles[i] = sorted_values[counter.kth(k)]
+    return percentiles
+
+
+def sliding_windows(times, values, length):
+    """Mean, p95 and max of the window of the given length at every job."""
+    starts = np.arange(len(times))
+    ends = window_ends(times, length.to_timedelta64().astype("timedelta64[ns]"))
+    return pd.DataFrame(
+        {
+            "start_index": starts,
+            "end_index": ends,
+            "jobs": ends - starts,
+            "mean": window_means(values, starts, ends),
+            "p95": window_percentiles(values, starts, ends),
+            "max": window_maxima(values, starts, ends),
+        }
+    )
+
+
+def worst_windows(windows, metric, top=TOP_WINDOWS, min_jobs=MIN_JOBS):
+    """The top windows by metric that do not overlap a worse one."""
+    candidates = windows[windows["jobs"] >= min_jobs].sort_values(
+        metric, ascending=False, kind="stable"
+    )
+    chosen = []
+    for row in candidates.itertuples(index=False):
+        if all(
+            row.end_index <= other.start_index or row.start_index >= other.end_index
+            for other in chosen
+        ):
+            chosen.append(row)
+            if len(chosen) == top:
+                break
+    return pd.DataFrame(chosen, columns=windows.columns)
+
+
+def segment_cost(prefix, prefix_sq, start, ends):
+    """Sum of squared deviations from the mean of each [start, end)."""
+    count = ends - start
+    total = prefix[ends] - prefix[start]
+    return prefix_sq[ends] - prefix_sq[start] - total**2 / count
+
+
+def change_points(
+    times,
+    values,
+    min_segment=MIN_SEGMENT_JOBS,
+    min_duration=pd.Timedelta(MIN_SEGMENT_DURATION),
+):
+    """Sustained shifts in the mean of values, by binary segmentation.
+
+    A segment is split where the drop in squared deviations is largest, if
+    that drop exceeds a BIC penalty. The noise level is the standard deviation
+    of all values: jobs of one session are correlated, and the median absolute
+    deviation let bursts within a session pass as regimes. Both sides of a
+    split need min_segment jobs and must last min_duration, from their first
+    submission to the first of the next segment (or the last submission).
+    Returns the sorted indices where new segments begin.
+    """
+    n = len(values)
+    prefix = np.r_[0.0, np.cumsum(values)]
+    prefix_sq = np.r_[0.0, np.cumsum(values**2)]
+    penalty = 2 * max(values.std(), 1e-9) ** 2 * np.log(n)
+    stops = np.r_[times, times[-1:]]
+    min_duration = pd.Timedelta(min_duration).to_timedelta64()
+
+    found = []
+    segments = [(0, n)]
+    while segments:
+        start, end = segments.pop()
+        splits = np.arange(start + min_segment, end - min_segment + 1)
+        splits = splits[
+            (times[splits] - times[start] >= min_duration)
+            & (stops[end] - times[splits] >= min_duration)
+        ]
+        if len(splits) == 0:
+            continue
+        whole = segment_cost(prefix, prefix_sq, start, np.array([end]))[0]
+        left = segment_cost(prefix, prefix_sq, start, splits)
+        right = (
+            prefix_sq[end]
+            - prefix_sq[splits]
+            - (prefix[end] - prefix[splits]) ** 2 / (end - splits)
+        )
+        gain = whole - (left + right)
+        best = int(np.argmax(gain))
+        if gain[best] > penalty:
+            split = int(splits[best])
+            found.append(split)
+            segments += [(start, split), (split, end)]
+    return sorted(found)
+
+
+def regimes(times, values, boundaries):
+    """Summary of the queue time between consecutive change points."""
+    edges = [0] + boundaries + [len(values)]
+    rows = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        segment = values[start:end]
+        rows.append(
+            {
+                "start": times[start],
+                "end": times[end - 1],
+                "jobs": end - start,
+                "mean": segment.mean(),
+                "median": np.median(segment),
+                "p95": np.quantile(segment, 0.95),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rank the worst contiguous periods of queue wait and find "
+        "sustained shifts in it."
+    )
+    parser.add_argument(
+        "--window",
+        action="append",
+        help=f"Window length, e.g. 2h or 30min (default: {', '.join(WINDOWS)})",
+    )
+    parser.add_argument("--top", type=int, default=TOP_WINDOWS)
+    parser.add_argument("--min-jobs", type=int, default=MIN_JOBS)
+    parser.add_argument(
+        "--min-segment-jobs",
+        type=int,
+        default=MIN_SEGMENT_JOBS,
+        help="Fewest jobs between two change points",
+    )
+    parser.add_argument(
+        "--min-segment-duration",
+        default=MIN_SEGMENT_DURATION,
+        help="Shortest time between two change points, e.g. 1D or 12h",
+    )
+    args = parser.parse_args()
+    for window in args.window or WINDOWS:
+        if pd.Timedelta(window) <= pd.Timedelta(0):
+            parser.error(f"--window must be a positive length, not {window}")
+    if pd.Timedelta(args.min_segment_duration) < pd.Timedelta(0):
+        parser.error("--min-segment-duration must not be negative")
+
+    # Read the merged job information file
+    df = load_merged_job_info()
+    df["queue_time"] = (df["Start"] - df["Submit"]).dt.total_seconds()
+    df = df.dropna(subset=["queue_time"]).sort_values("Submit", kind="stable")
+    times = df["Submit"].to_numpy()
+    values = df["queue_time"].to_numpy(dtype=float)
+
+    incidents = []
+    for window in args.window or WINDOWS:
+        length = pd.Timedelta(window)
+        windows = sliding_windows(times, values, length)
+        for metric in METRICS:
+            worst = worst_windows(windows, metric, args.top, args.min_jobs)
+            worst.insert(0, "rank", np.arange(1, len(worst) + 1))
+            worst.insert(0, "metric", metric)
+            worst.insert(0, "window", window)
+            worst.insert(3, "start", times[worst["start_index"].to_numpy(int)])
+            worst.insert(4, "end", times[worst["start_index"].to_numpy(int)] + length)
+            incidents.append(worst.drop(columns=["start_index", "end_index"]))
+
+    pd.concat(incidents, ignore_index=True).to_csv(
+        "/streaming_analysis/data/outputs/queue_time_incident_windows.csv",
+        index=False,
+    )
+
+    # Shifts are found on log(1 + queue time), so the long tail of a few
+    # stuck jobs does not hide changes in the typical wait
+    boundaries = change_points(
+        times,
+        np.log1p(values),
+        args.min_segment_jobs,
+        args.min_segment_duration,
+    )
+    regimes(times, values, boundaries).to_csv(
+        "/streaming_analysis/data/outputs/queue_time_regimes.csv", index=False
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+ROOT = Path("/streaming_analysis")
+SCRIPTS = ROOT / "scripts"
+DATA = ROOT / "data"
+PLOTS = ROOT / "plots"
+STATE_PATH = DATA / "cache" / "pipeline_state.json"
+
+SIZES = ["128", "256", "512", "1024"]
+SCAN_TIMES = [
+    "scan_times_2709_3688.csv",
+    "scan_times_3813_4226.csv",
+    "scan_times_4227_4644.csv",
+    "scan_times_4653_4698.csv",
+]
+
+MERGED_JOB_INFO = DATA / "file_transfer" / "merged_job_info.csv"
+OFFLOAD_TIMES = DATA / "file_transfer" / "ncem_offload_times.csv"
+OFFLOAD_TIMES_PER_SCAN = DATA / "file_transfer" / "ncem_offload_times_per_scan.csv"
+SAVE_TIME_STATS = DATA / "file_transfer" / "save_time_stats.csv"
+QUEUE_TIME_ROLLUP = DATA / "cache" / "rollups" / "queue_time.json"
+STREAMING_TIMES = [DATA / "streaming" / f"streaming_times_{size}.csv" for size in SIZES]
+TRANSFER_STATISTICS = [
+    DATA / "outputs" / f"statistics_transfers_{size}.csv" for size in SIZES
+]
+
+# Shared code that every stage imports
+COMMON = sorted((SCRIPTS / "common").glob("*.py"))
+
+# extract_job_info.py and file_save_times.sh must be run on Perlmutter, so their
+# outputs (slurm_job_info.csv, scan_times_*.csv) are inputs here.
+STAGES = {
+    "join_columns_from_db": {
+        "script": "file_transfer/join_columns_from_db.py",
+        "inputs": [DATA / "file_transfer" / "slurm_job_info.csv"]
+        + [
+            DATA / "file_transfer" / "distiller_db" / f"{size}_{size}.csv"
+            for size in SIZES
+        ],
+        "outputs": [MERGED_JOB_INFO],
+    },
+    "offload_times": {
+        "script": "file_transfer/offload_times.py",
+        "inputs": [DATA / "file_transfer" / "write_times.csv"],
+        "outputs": [
+            OFFLOAD_TIMES,
+            OFFLOAD_TIMES_PER_SCAN,
+            DATA / "file_transfer" / "ncem_offload_time_percentiles.csv",
+        ],
+    },
+    "join_streaming_data": {
+        "script": "streaming/join_streaming_data.py",
+        "inputs": [DATA / "streaming" / "ncem_file_created_times.csv"]
+        + [DATA / "streaming" / filename for filename in SCAN_TIMES],
+        "outputs": STREAMING_TIMES,
+    },
+    "create_queue_time_plots": {
+        "script": "queue_time/create_queue_time_plots.py",
+        "inputs": [MERGED_JOB_INFO],
+        "outputs": [
+            PLOTS / "queue_time_scatter.png",
+            PLOTS / "queue_time_scatter_by_date.png",
+            PLOTS / "queue_time_hist.png",
+        ],
+    },
+    "update_queue_time_rollup": {
+        "script": "queue_time/update_queue_time_rollup.py",
+        "inputs": [MERGED_JOB_INFO],
+        "outputs": [
+            QUEUE_TIME_ROLLUP,
+            DATA / "outputs" / "queue_time_rollup_by_month.csv",
+        ],
+    },
+    "rank_the_worst_days": {
+        "script": "queue_time/rank_the_worst_days.py",
+        "inputs": [MERGED_JOB_INFO],
+        "outputs": [
+            DATA / "outputs" / "ranked_days.csv",
+            DATA / "outputs" / "ranked_days_by_month.csv",
+        ],
+    },
+    "worst_periods": {
+        "script": "queue_time/worst_periods.py",
+        "inputs": [MERGED_JOB_INFO],
+        "outputs": [
+            DATA / "outputs" / "queue_time_incident_windows.csv",
+            DATA / "outputs" / "queue_time_regimes.csv",
+        ],
+    },
+    "statistics_queue_time": {
+        "script": "queue_time/statistics_queue_time.py",
+        "inputs": [MERGED_JOB_INFO],
+        "outputs": [
+            DATA / "outputs" / "queue_time_statistics_with_outliers.txt",
+            DATA / "outputs" / "queue_time_statistics_without_outliers.txt",
+            DATA / "outputs" / "queue_time_statistics_by_month.csv",
+        ],
+    },
+    "create_transfer_histograms": {
+        "script": "compare/create_transfer_histograms.py",
+        "inputs": [MERGED_JOB_INFO, OFFLOAD_TIMES, OFFLOAD_TIMES_PER_SCAN]
+        + STREAMING_TIMES,
+        "outputs": [PLOTS / f"transfer_histogram_{size}.png" for size in SIZES]
+        + [DATA / "outputs" / "transfer_histogram_bins.csv"],
+    },
+    "statistics_transfer_times": {
+        "script": "compare/statistics_transfer_times.py",
+        "inputs": [
+            MERGED_JOB_INFO,
+            OFFLOAD_TIMES,
+            OFFLOAD_TIMES_PER_SCAN,
+            SAVE_TIME_STATS,
+        ]
+        + STREAMING_TIMES,
+        "outputs": TRANSFER_STATISTICS
+        + [DATA / "outputs" / "transfer_statistics_by_month.csv"],
+    },
+    "create_subplot_histograms": {
+        "script": "compare/create_subplot_histograms.py",
+        "inputs": [
+            MERGED_JOB_INFO,
+            OFFLOAD_TIMES,
+            OFFLOAD_TIMES_PER_SCAN,
+            SAVE_TIME_STATS,
+        ]
+        + STREAMING_TIMES,
+        "outputs": [
+            PLOTS / "transfer_histogram_combined.png",
+            DATA / "outputs" / "transfer_histogram_combined_bins.csv",
+        ],
+    },
+    "simulate_backlog": {
+        "script": "compare/simulate_backlog.py",
+        "inputs": [MERGED_JOB_INFO, OFFLOAD_TIMES_PER_SCAN, SAVE_TIME_STATS]
+        + STREAMING_TIMES,
+        "outputs": [DATA / "outputs" / "backlog_simulation.csv"],
+    },
+    "latency_timeline": {
+        "script": "compare/latency_timeline.py",
+        "inputs": [
+            MERGED_JOB_INFO,
+            OFFLOAD_TIMES,
+            OFFLOAD_TIMES_PER_SCAN,
+            SAVE_TIME_STATS,
+        ]
+        + STREAMING_TIMES,
+        "outputs": [
+            DATA / "outputs" / "latency_timeline.csv",
+            DATA / "outputs" / "critical_path.csv",
+            PLOTS / "critical_path.png",
+        ],
+    },
+    "scaling_model": {
+        "script": "compare/scaling_model.py",
+        "inputs": [
+            MERGED_JOB_INFO,
+            OFFLOAD_TIMES,
+            OFFLOAD_TIMES_PER_SCAN,
+            SAVE_TIME_STATS,
+        ]
+        + STREAMING_TIMES,
+        "outputs": [
+            DATA / "outputs" / "scaling_model_fit.csv",
+            DATA / "outputs" / "scaling_model_projections.csv",
+        ],
+    },
+    "statistics_comparison_table": {
+        "script": "compare/statistics_comparison_table.py",
+        "inputs": TRANSFER_STATISTICS,
+        "outputs": [DATA / "outputs" / "statistics_table.tex"],
+    },
+}
+
+
+def stage_dependencies(stages):
+    """Map each stage to the stages that produce its inputs."""
+    producers = {
+        output: name for name, stage in stages.items() for output in stage["outputs"]
+    }
+    return {
+        name: {producers[path] for path in stage["inputs"] if path in producers}
+        for name, stage in stages.items()
+    }
+
+
+class FileHasher:
+    """sha256 of files, reusing the stored hash while size and mtime match."""
+
+    def __init__(self, known):
+        self.known = known
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        key = str(path)
+        entry = self.known.get(key)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        self.known[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256.hexdigest(),
+        }
+        return self.known[key]["sha256"]
+
+
+def stage_fingerprint(stage, hasher):
+    """Content hashes of a stage's script, shared code and inputs."""
+    paths = [SCRIPTS / stage["script"]] + COMMON + list(stage["inputs"])
+    fingerprint = {str(path): hasher(path) for path in paths}
+    # Preview figures must not count as up to date for a full-resolution run;
+    # only stages that save figures under PLOTS depend on it
+    if any(PLOTS in path.parents for path in stage["outputs"]):
+        fingerprint["PLOT_PREVIEW"] = os.environ.get("PLOT_PREVIEW", "0")
+    # Only the compare stages depend on how the offload time is added
+    if OFFLOAD_TIMES in stage["inputs"]:
+        fingerprint["OFFLOAD_MODEL"] = os.environ.get("OFFLOAD_MODEL", "mean")
+    return fingerprint
+
+
+def run_subprocess(stage):
+    """Run a stage script in a fresh interpreter."""
+    subprocess.run([sys.executable, str(SCRIPTS / stage["script"])], check=True)
+
+
+def run_in_process(stage):
+    """Import a stage script and call its main() in this interpreter.
+
+    Stage modules are only imported when the stage runs, so matplotlib and
+    seaborn are not loaded unless a plotting stage is out of date. Datasets
+    loaded through common.datasets are shared between stages.
+    """
+    path = SCRIPTS / stage["script"]
+    spec = importlib.util.spec_from_file_location(f"stage_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that render_figures can pickle the stage's plot functions
+    sys.modules[spec.name] = module
+    # Stages with a command line run with their defaults, as in a subprocess
+    argv = sys.argv
+    sys.argv = [str(path)]
+    try:
+        spec.loader.exec_module(module)
+        module.main()
+    finally:
+        sys.argv = argv
+        sys.modules.pop(spec.name, None)
+        # Give the next stage the same matplotlib state as a fresh interpreter
+        if "matplotlib.pyplot" in sys.modules:
+            import matplotlib
+            import matplotlib.pyplot as plt
+
+            plt.close("all")
+            matplotlib.rc_file_defaults()
+
+
+def run_stage(name, stage, state, hasher, force, execute):
+    """Run one stage unless its inputs are unchanged since the last success."""
+    fingerprint = stage_fingerprint(stage, hasher)
+    outputs_exist = all(path.exists() for path in stage["outputs"])
+    if not force and outputs_exist and state["stages"].get(name) == fingerprint:
+        return "skipped", 0.0
+
+    t0 = time.time()
+    execute(stage)
+    elapsed = time.time() - t0
+
+    state["stages"][name] = fingerprint
+    return "ran", elapsed
+
+
+def load_state():
+    if STATE_PATH.exists():
+        with open(STATE_PATH, "r") as f:
+            return json.load(f)
+    return {"files": {}, "stages": {}}
+
+
+def save_state(state):
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def run_pipeline(stages, jobs=None, force=False, in_process=False):
+    """Run stages in dependency order, running independent stages concurrently.
+
+    With in_process, every stage runs one after another in this interpreter.
+    """
+    if in_process:
+        execute = run_in_process
+        jobs = 1
+    else:
+        execute = run_subprocess
+
+    state = load_state()
+    hasher = FileHasher(state["files"])
+    dependencies = stage_dependencies(stages)
+    pending = set(stages)
+    done = set()
+    failed = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        while pending or running:
+            # Stages whose producers have all finished are ready to run
+            for name in sorted(pending):
+                if dependencies[name] & failed:
+                    pending.discard(name)
+                    failed.add(name)
+                    print(f"{name}: not run, an upstream stage failed")
+                elif dependencies[name] <= done:
+                    pending.discard(name)
+                    future = executor.submit(
+                        run_stage, name, stages[name], state, hasher, force, execute
+                    )
+                    running[future] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    status, elapsed = future.result()
+                except subprocess.CalledProcessError as e:
+                    failed.add(name)
+                    print(f"{name}: failed with exit code {e.returncode}")
+                    continue
+                except Exception:
+                    failed.add(name)
+                    traceback.print_exc()
+                    print(f"{name}: failed")
+                    continue
+                done.add(name)
+                if status == "ran":
+                    print(f"{name}: ran in {elapsed:.1f} s")
+                else:
+                    print(f"{name}: up to date")
+
+    save_state(state)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the analysis stages whose inputs have changed."
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        help="Only run these stages and their upstream stages (default: all)",
+    )
+    parser.add_argument("--force", action="store_true", help="Rerun every stage")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=None, help="Concurrent stages"
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run every stage's main() in this interpreter, sharing loaded data",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="Save figures at low dpi for quick iteration",
+    )
+    parser.add_argument(
+        "--offload-model",
+        choices=["mean", "resample", "convolve"],
+        help="How the compare stages add the offload time (default: mean)",
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="Print the stage graph and exit"
+    )
+    args = parser.parse_args()
+
+    dependencies = stage_dependencies(STAGES)
+    if args.list:
+        for name in STAGES:
+            upstream = ", ".join(sorted(dependencies[name])) or "-"
+            print(f"{name} <- {upstream}")
+        return
+
+    selected = set(args.stages or STAGES)
+    unknown = selected - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    # Pull in everything upstream of the requested stages
+    queue = list(selected)
+    while queue:
+        for upstream in dependencies[queue.pop()]:
+            if upstream not in selected:
+                selected.add(upstream)
+                queue.append(upstream)
+
+    stages = {name: stage for name, stage in STAGES.items() if name in selected}
+    if args.preview:
+        os.environ["PLOT_PREVIEW"] = "1"
+    if args.offload_model:
+        os.environ["OFFLOAD_MODEL"] = args.offload_model
+    if not run_pipeline(
+        stages, jobs=args.jobs, force=args.force, in_process=args.in_process
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
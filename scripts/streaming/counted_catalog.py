@@ -0,0 +1,199 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from extract_file_save_times import parse_fourd_name
+
+# A directory whose last change, or newest file, is more recent than this at
+# refresh time may still have files being written, so it is re-listed and its
+# recent files re-stat'ed on the next refresh even if its mtime is unchanged
+SETTLE_NS = 5 * 60 * 1_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    entry_count INTEGER NOT NULL,
+    newest_mtime_ns INTEGER NOT NULL,
+    refreshed_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    distiller_id TEXT NOT NULL,
+    scan_number INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (directory, name)
+);
+CREATE INDEX IF NOT EXISTS files_scan_number ON files (scan_number);
+CREATE INDEX IF NOT EXISTS files_distiller_id ON files (distiller_id);
+CREATE INDEX IF NOT EXISTS files_directory_scan ON files (directory, scan_number);
+"""
+
+
+def open_catalog(database_path):
+    conn = sqlite3.connect(database_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def is_settled(row, mtime_ns, entry_count):
+    """True if a directory is unchanged and was quiet when it was last listed.
+
+    The entry count is compared as well as the mtime, which may not change
+    when a file is added within the filesystem's timestamp granularity.
+    """
+    if row is None:
+        return False
+    stored_mtime_ns, stored_entry_count, newest_mtime_ns, refreshed_ns = row
+    return (
+        stored_mtime_ns == mtime_ns
+        and stored_entry_count == entry_count
+        and refreshed_ns - max(stored_mtime_ns, newest_mtime_ns) > SETTLE_NS
+    )
+
+
+def refresh_directory(conn, directory):
+    """Bring the catalog entries of one counted directory up to date.
+
+    A settled directory whose mtime and entry count have not changed is
+    skipped after listing only its names, without stat'ing any file. Otherwise
+    it is listed once; new files are stat'ed and added, files that disappeared
+    are removed, and files modified shortly before the last refresh are
+    re-stat'ed in case they were still being written.
+    Returns the number of files added, updated or removed.
+    """
+    directory = os.path.abspath(directory)
+    mtime_ns = os.stat(directory).st_mtime_ns
+    row = conn.execute(
+        "SELECT mtime_ns, entry_count, newest_mtime_ns, refreshed_ns "
+        "FROM directories WHERE path = ?",
+        (directory,),
+    ).fetchone()
+    if row is not None and is_settled(row, mtime_ns, len(os.listdir(directory))):
+        return 0
+
+    refreshed_ns = time.time_ns()
+    known = dict(
+        conn.execute(
+            "SELECT name, mtime_ns FROM files WHERE directory = ?", (directory,)
+        )
+    )
+    recent_ns = (row[3] if row else 0) - SETTLE_NS
+
+    upserts = []
+    listed = set()
+    entry_count = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            entry_count += 1
+            parsed = parse_fourd_name(entry.name)
+            if parsed is None:
+                continue
+            listed.add(entry.name)
+            if entry.name in known and known[entry.name] < recent_ns:
+                continue
+            stat = entry.stat()
+            if known.get(entry.name) == stat.st_mtime_ns:
+                continue
+            distiller_id, scan_number = parsed
+            timestamp = "_".join(entry.name.split("_")[1:-2])
+            upserts.append(
+                (
+                    directory,
+                    entry.name,
+                    timestamp,
+                    distiller_id,
+                    scan_number,
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                )
+            )
+    removed = [(directory, name) for name in known.keys() - listed]
+
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", upserts
+        )
+        conn.executemany("DELETE FROM files WHERE directory = ? AND name = ?", removed)
+        (newest_mtime_ns,) = conn.execute(
+            "SELECT COALESCE(MAX(mtime_ns), 0) FROM files WHERE directory = ?",
+            (directory,),
+        ).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?)",
+            (directory, mtime_ns, entry_count, newest_mtime_ns, refreshed_ns),
+        )
+    return len(upserts) + len(removed)
+
+
+def refresh_catalog(conn, directories):
+    """Refresh several directories; returns {directory: files changed}."""
+    return {directory: refresh_directory(conn, directory) for directory in directories}
+
+
+def query_files(conn, scan_number_begin=None, scan_number_end=None, directory=None):
+    """Catalog rows for an inclusive scan range, optionally in one directory."""
+    clauses = []
+    parameters = []
+    if scan_number_begin is not None:
+        clauses.append("scan_number >= ?")
+        parameters.append(scan_number_begin)
+    if scan_number_end is not None:
+        clauses.append("scan_number <= ?")
+        parameters.append(scan_number_end)
+    if directory is not None:
+        clauses.append("directory = ?")
+        parameters.append(os.path.abspath(directory))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return pd.read_sql_query(
+        f"SELECT * FROM files {where} ORDER BY distiller_id, scan_number",
+        conn,
+        params=parameters,
+    )
+
+
+def main():
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Refresh and query the catalog of counted FOURD_*.h5 files."
+    )
+    parser.add_argument("directories", nargs="*", help="Counted directories to refresh")
+    parser.add_argument(
+        "--root",
+        help="Also refresh every date directory directly under this directory",
+    )
+    parser.add_argument(
+        "--database",
+        default=f"{script_directory}/data/counted_catalog.sqlite",
+        help="SQLite catalog file",
+    )
+    parser.add_argument(
+        "--range",
+        nargs=2,
+        type=int,
+        metavar=("BEGIN", "END"),
+        help="Print the catalogued files in this inclusive scan range",
+    )
+    args = parser.parse_args()
+
+    directories = list(args.directories)
+    if args.root:
+        with os.scandir(args.root) as entries:
+            directories += sorted(entry.path for entry in entries if entry.is_dir())
+
+    conn = open_catalog(args.database)
+    for directory, changed in refresh_catalog(conn, directories).items():
+        print(f"{directory}: {changed} files changed")
+    if args.range:
+        print(query_files(conn, *args.range).to_csv(index=False), end="")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
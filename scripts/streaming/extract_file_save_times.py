@@ -1,61 +1,212 @@
+import argparse
 import csv
 import os
 import sys
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 
 
-def extract_file_info(input_directory, scan_number_begin, scan_number_end):
-    # Initialize a list to store file information
-    file_info_list = []
-
-    # Loop through all files in the specified directory
-    for filename in os.listdir(input_directory):
-        if filename.startswith("FOURD_") and filename.endswith(".h5"):
-            # Extract the distiller_id and scan_number from the filename
-            parts = filename.split("_")
-            distiller_id = parts[-2]
-            scan_number = int(parts[-1].split(".")[0])
-            if distiller_id == "00000":
+def parse_fourd_name(filename):
+    """Return (distiller_id, scan_number) for FOURD_<ts>_<distiller_id>_<scan>.h5.
+
+    Returns None for other files and for files without a distiller ID (00000).
+    """
+    if not (filename.startswith("FOURD_") and filename.endswith(".h5")):
+        return None
+    parts = filename.split("_")
+    distiller_id = parts[-2]
+    if distiller_id == "00000":
+        return None
+    return distiller_id, int(parts[-1].split(".")[0])
+
+
+def format_mtime(mtime_ns):
+    """Local time of a nanosecond mtime, to the second."""
+    return datetime.fromtimestamp(mtime_ns // 1_000_000_000).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+
+
+def scan_directory(input_directory, scan_ranges):
+    """Collect [distiller_id, scan_number, datetime] rows for several ranges.
+
+    The directory is listed once with os.scandir, and each FOURD file is put in
+    every (inclusive) range that contains it, as when each range was scanned
+    on its own: a binary search over the sorted range starts finds the last
+    range starting at or before the scan, and the ranges before it are walked
+    back while their running maximum end still reaches the scan. Only files
+    inside a range are stat'ed, once, through the DirEntry.
+    Returns {(begin, end): rows}.
+    """
+    scan_ranges = sorted(set(scan_ranges))
+    begins = [begin for begin, _ in scan_ranges]
+    max_ends = []
+    for _, end in scan_ranges:
+        max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+    rows = {scan_range: [] for scan_range in scan_ranges}
+
+    with os.scandir(input_directory) as entries:
+        for entry in entries:
+            parsed = parse_fourd_name(entry.name)
+            if parsed is None:
                 continue
+            distiller_id, scan_number = parsed
 
-            # Check if the scan_number is within the specified range
-            if scan_number_begin <= scan_number <= scan_number_end:
-                # Get the last modified time of the file
-                file_stat = os.stat(os.path.join(input_directory, filename))
-                last_modified_time = datetime.fromtimestamp(
-                    file_stat.st_mtime
-                ).strftime("%Y-%m-%d %H:%M:%S")
+            i = bisect_right(begins, scan_number) - 1
+            mtime = None
+            while i >= 0 and max_ends[i] >= scan_number:
+                if scan_number <= scan_ranges[i][1]:
+                    if mtime is None:
+                        mtime = format_mtime(entry.stat().st_mtime_ns)
+                    rows[scan_ranges[i]].append([distiller_id, scan_number, mtime])
+                i -= 1
 
-                # Append the distiller_id, scan_number, last_modified_time
-                file_info_list.append([distiller_id, scan_number, last_modified_time])
+    for range_rows in rows.values():
+        range_rows.sort(key=lambda x: (x[0], x[1]))
+    return rows
 
-    # Sort the list by distiller_id
-    file_info_list.sort(key=lambda x: x[0])
 
-    # Initialize the CSV file with headers
-    script_directory = os.path.dirname(os.path.realpath(__file__))
-    csv_filename = (
-        f"{script_directory}/data/scan_times_{scan_number_begin}_{scan_number_end}.csv"
-    )
+def scan_catalog(database_path, input_directory, scan_ranges):
+    """Same as scan_directory, answered from the counted-file catalog.
+
+    The directory's catalog entries are refreshed first (a no-op for a settled
+    directory), then each range is an index lookup on scan_number.
+    """
+    from counted_catalog import open_catalog, query_files, refresh_directory
+
+    conn = open_catalog(database_path)
+    try:
+        refresh_directory(conn, input_directory)
+        rows = {}
+        for scan_range in sorted(scan_ranges):
+            files = query_files(conn, *scan_range, directory=input_directory)
+            rows[scan_range] = [
+                [distiller_id, scan_number, format_mtime(mtime_ns)]
+                for distiller_id, scan_number, mtime_ns in zip(
+                    files["distiller_id"], files["scan_number"], files["mtime_ns"]
+                )
+            ]
+    finally:
+        conn.close()
+    return rows
 
+
+def write_scan_times(output_directory, scan_range, rows):
+    scan_number_begin, scan_number_end = scan_range
+    csv_filename = os.path.join(
+        output_directory, f"scan_times_{scan_number_begin}_{scan_number_end}.csv"
+    )
     with open(csv_filename, "w", newline="") as csvfile:
         csvwriter = csv.writer(csvfile)
         csvwriter.writerow(["distiller_id", "scan_number", "datetime"])
+        csvwriter.writerows(rows)
 
-        # Write the sorted list to the CSV file
-        for row in file_info_list:
-            csvwriter.writerow(row)
 
+def extract_all_file_info(
+    ranges_by_directory, output_directory, threads=1, catalog=None
+):
+    """Scan each directory once for all of its ranges and write every CSV.
 
-if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print(
-            "Usage: python extract_file_info.py <input_directory> <scan_number_begin> <scan_number_end>"
+    ranges_by_directory maps a counted directory (one per date) to its list of
+    (scan_number_begin, scan_number_end) ranges. With threads > 1 the
+    directories are listed concurrently, which helps on network filesystems
+    where the time goes to waiting on metadata. With a catalog database path,
+    the ranges are looked up in the counted-file catalog instead.
+    """
+    if catalog is None:
+        scan = scan_directory
+    else:
+        scan = partial(scan_catalog, catalog)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        results = executor.map(lambda item: scan(*item), ranges_by_directory.items())
+        for rows_by_range in results:
+            for scan_range, rows in rows_by_range.items():
+                write_scan_times(output_directory, scan_range, rows)
+
+
+def extract_file_info(input_directory, scan_number_begin, scan_number_end):
+    """Write scan_times_<begin>_<end>.csv for one range of one directory."""
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    extract_all_file_info(
+        {input_directory: [(scan_number_begin, scan_number_end)]},
+        f"{script_directory}/data",
+    )
+
+
+def read_manifest(manifest_path):
+    """Read directory,scan_number_begin,scan_number_end rows into a dict."""
+    ranges_by_directory = {}
+    with open(manifest_path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            ranges_by_directory.setdefault(row["directory"], []).append(
+                (int(row["scan_number_begin"]), int(row["scan_number_end"]))
+            )
+    return ranges_by_directory
+
+
+def main():
+    # Original usage: <input_directory> <scan_number_begin> <scan_number_end>
+    if (
+        len(sys.argv) == 4
+        and not sys.argv[1].startswith("-")
+        and sys.argv[2].isdigit()
+        and sys.argv[3].isdigit()
+    ):
+        extract_file_info(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
+        return
+
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Write scan_times_<begin>_<end>.csv files from the last "
+        "modified times of counted FOURD_*.h5 files, one directory pass each."
+    )
+    parser.add_argument(
+        "input_directory", nargs="?", help="Counted directory for --range"
+    )
+    parser.add_argument(
+        "--range",
+        nargs=2,
+        type=int,
+        action="append",
+        default=[],
+        metavar=("BEGIN", "END"),
+        help="Inclusive scan number range (repeatable)",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="CSV of directory,scan_number_begin,scan_number_end rows",
+    )
+    parser.add_argument(
+        "--output-directory",
+        default=f"{script_directory}/data",
+        help="Where to write the scan_times_*.csv files",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=1, help="Directories listed concurrently"
+    )
+    parser.add_argument(
+        "--catalog",
+        help="Answer the ranges from this counted-file catalog (counted_catalog.py)",
+    )
+    args = parser.parse_args()
+
+    ranges_by_directory = read_manifest(args.manifest) if args.manifest else {}
+    if args.range:
+        if args.input_directory is None:
+            parser.error("--range needs an input_directory")
+        ranges_by_directory.setdefault(args.input_directory, []).extend(
+            tuple(scan_range) for scan_range in args.range
         )
-        sys.exit(1)
+    if not ranges_by_directory:
+        parser.error("give --manifest or an input_directory with --range")
+
+    extract_all_file_info(
+        ranges_by_directory, args.output_directory, args.threads, args.catalog
+    )
 
-    input_directory = sys.argv[1]
-    scan_number_begin = int(sys.argv[2])
-    scan_number_end = int(sys.argv[3])
 
-    extract_file_info(input_directory, scan_number_begin, scan_number_end)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from datetime import datetime
+
+from extract_file_save_times import parse_fourd_name
+
+# inotify event masks (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+EVENT_HEADER = struct.Struct("iIII")
+
+LOG_COLUMNS = [
+    "distiller_id",
+    "scan_number",
+    "nersc_write_time",
+    "ncem_created_time",
+    "time_difference_seconds",
+]
+
+
+class Inotify:
+    """Minimal inotify wrapper over libc, so no extra package is needed."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.paths[wd] = path
+        return wd
+
+    def read_events(self, timeout=None):
+        """Block until events arrive (or timeout seconds pass).
+
+        Returns a list of (directory, mask, name).
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        buffer = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + length].rstrip(b"\0").decode()
+            offset += length
+            events.append((self.paths.get(wd), mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def read_created_times(created_times_path):
+    """{scan_number: earliest receiver creation time, as epoch seconds}."""
+    created_times = {}
+    with open(created_times_path, "r", newline="") as f:
+        for row in csv.DictReader(f):
+            times = [
+                datetime.fromisoformat(row[column]).timestamp()
+                for column in ["time0", "time1", "time2", "time3"]
+                if row.get(column)
+            ]
+            if times:
+                created_times[int(row["scan_number"])] = min(times)
+    return created_times
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class LatencyWatcher:
+    """Follow counted directories and log the streaming latency of each scan.
+
+    For every FOURD_*.h5 file that is closed after writing (or moved in), the
+    file's mtime is compared with the earliest receiver creation time of its
+    scan, and a streaming_times-style row is appended to log_path. The
+    created-times CSV is watched as well: it is re-read when it is rewritten,
+    and scans that arrived before their creation times are logged then.
+    """
+
+    def __init__(self, directories, created_times_path, log_path, root=None):
+        self.created_times_path = os.path.abspath(created_times_path)
+        self.log_path = log_path
+        self.root = None if root is None else os.path.abspath(root)
+        self.inotify = Inotify()
+        self.created_times = {}
+        self.pending = {}
+
+        for directory in directories:
+            self.inotify.add_watch(
+                os.path.abspath(directory), IN_CLOSE_WRITE | IN_MOVED_TO
+            )
+        if self.root is not None:
+            # New date directories under root are watched as they appear
+            self.inotify.add_watch(self.root, IN_CREATE)
+        self.inotify.add_watch(
+            os.path.dirname(self.created_times_path), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if os.path.exists(self.created_times_path):
+            self.created_times = read_created_times(self.created_times_path)
+
+        new_log = not os.path.exists(log_path) or os.path.getsize(log_path) == 0
+        self.log_fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if new_log:
+            os.write(self.log_fd, (",".join(LOG_COLUMNS) + "\n").encode())
+
+    def log(self, distiller_id, scan_number, write_time):
+        created_time = self.created_times[scan_number]
+        line = ",".join(
+            [
+                distiller_id,
+                str(scan_number),
+                format_time(write_time),
+                format_time(created_time),
+                f"{abs(write_time - created_time):.3f}",
+            ]
+        )
+        # One write per record, so lines are never interleaved
+        os.write(self.log_fd, (line + "\n").encode())
+
+    def handle_file(self, directory, name):
+        parsed = parse_fourd_name(name)
+        if parsed is None:
+            return
+        distiller_id, scan_number = parsed
+        try:
+            write_time = os.stat(os.path.join(directory, name)).st_mtime_ns / 1e9
+        except FileNotFoundError:
+            return
+        if scan_number in self.created_times:
+            self.log(distiller_id, scan_number, write_time)
+        else:
+            self.pending[scan_number] = (distiller_id, write_time)
+
+    def reload_created_times(self):
+        self.created_times = read_created_times(self.created_times_path)
+        for scan_number in sorted(self.pending.keys() & self.created_times.keys()):
+            distiller_id, write_time = self.pending.pop(scan_number)
+            self.log(distiller_id, scan_number, write_time)
+
+    def handle_events(self, events):
+        for directory, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                print("inotify queue overflowed; events were lost", file=sys.stderr)
+            elif directory is None:
+                continue
+            elif directory == self.root and mask & IN_CREATE and mask & IN_ISDIR:
+                self.inotify.add_watch(
+                    os.path.join(directory, name), IN_CLOSE_WRITE | IN_MOVED_TO
+                )
+            elif os.path.join(directory, name) == self.created_times_path:
+                self.reload_created_times()
+            else:
+                self.handle_file(directory, name)
+
+    def run(self, timeout=None):
+        """Handle events until interrupted, or until timeout seconds of quiet."""
+        while True:
+            events = self.inotify.read_events(timeout)
+            if not events:
+                return
+            self.handle_events(events)
+
+    def close(self):
+        self.inotify.close()
+        os.close(self.log_fd)
+
+
+def main():
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Append the streaming latency of each counted scan to a log "
+        "as its FOURD_*.h5 file is closed."
+    )
+    parser.add_argument("directories", nargs="*", help="Counted directories to watch")
+    parser.add_argument(
+        "--root", help="Also watch date directories created under this directory"
+    )
+    parser.add_argument(
+        "--created-times",
+        default=f"{script_directory}/data/ncem_file_created_times.csv",
+        help="Receiver creation times (scan_number,time0,...,time3)",
+    )
+    parser.add_argument(
+        "--log",
+        default=f"{script_directory}/data/streaming_latency_live.csv",
+        help="Append-only latency log",
+    )
+    args = parser.parse_args()
+    if not args.directories and args.root is None:
+        parser.error("give directories to watch or --root")
+
+    watcher = LatencyWatcher(
+        args.directories, args.created_times, args.log, root=args.root
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import csv
+import json
+import os
+import stat
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = (
+    Path(__file__).resolve().parents[1] / "scripts/file_transfer/extract_job_info.py"
+)
+
+# Stands in for sacct: answers the queries extract_job_info.py makes from a
+# JSON list of jobs, logs every call, and rejects options sacct does not have
+FAKE_SACCT = """#!{python}
+import json
+import os
+import sys
+
+KNOWN = {{
+    "--user", "--format", "--noheader", "--parsable2", "--starttime",
+    "--endtime", "--jobs", "--allocations", "--state", "--nnodes", "--qos",
+}}
+options = dict(arg.partition("=")[::2] for arg in sys.argv[1:])
+unknown = set(options) - KNOWN
+if unknown:
+    sys.exit("sacct: unrecognized option " + ", ".join(sorted(unknown)))
+with open(os.environ["FAKE_SACCT_LOG"], "a") as f:
+    f.write(json.dumps(sys.argv[1:]) + "\\n")
+with open(os.environ["FAKE_SACCT_JOBS"]) as f:
+    jobs = json.load(f)
+
+
+def in_window(job):
+    return options["--starttime"] <= job["submit"][:10] < options["--endtime"]
+
+
+def row(job):
+    return "|".join([
+        job["name"], job["id"], "00:30:00", "00:01:00", job["submit"],
+        job["start"], job["end"], job["nodes"], job["qos"], "dstlr", "0:0",
+    ])
+
+
+if options.get("--format") == "JobID":
+    for job in jobs:
+        if in_window(job):
+            print(job["id"])
+            print(job["id"] + ".batch")
+elif "--jobs" in options:
+    ids = options["--jobs"].split(",")
+    for job in jobs:
+        if job["id"] in ids:
+            print(row(job))
+else:
+    for job in jobs:
+        if (
+            in_window(job)
+            and job["end"] != "Unknown"
+            and job["nodes"] == options.get("--nnodes", job["nodes"])
+        ):
+            print(row(job))
+"""
+
+
+def job(job_id, submit, end="2023-01-05T10:10:00", nodes="4"):
+    return {
+        "id": job_id,
+        "name": "distiller-count-" + job_id,
+        "submit": submit,
+        "start": "Unknown" if end == "Unknown" else submit,
+        "end": end,
+        "nodes": nodes,
+        "qos": "realtime_staff",
+    }
+
+
+class Harvest:
+    def __init__(self, tmp_path):
+        bin_directory = tmp_path / "bin"
+        bin_directory.mkdir()
+        sacct = bin_directory / "sacct"
+        sacct.write_text(FAKE_SACCT.format(python=sys.executable))
+        sacct.chmod(sacct.stat().st_mode | stat.S_IEXEC)
+
+        self.jobs_path = tmp_path / "jobs.json"
+        self.log_path = tmp_path / "sacct.log"
+        self.output = tmp_path / "slurm_job_info.csv"
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_directory}{os.pathsep}{os.environ['PATH']}",
+            FAKE_SACCT_JOBS=str(self.jobs_path),
+            FAKE_SACCT_LOG=str(self.log_path),
+        )
+
+    def run(self, jobs, *args):
+        """Job IDs in the CSV and the number of sacct calls of one run."""
+        self.jobs_path.write_text(json.dumps(jobs))
+        self.log_path.write_text("")
+        subprocess.run(
+            [
+                sys.executable,
+                str(SCRIPT),
+                "--output",
+                str(self.output),
+                "--start-date",
+                "2023-01-01",
+                "--end-date",
+                "2023-03-01",
+                *args,
+            ],
+            env=self.env,
+            check=True,
+        )
+        with open(self.output, newline="") as f:
+            job_ids = [row["Job ID"] for row in csv.DictReader(f)]
+        return job_ids, len(self.log_path.read_text().splitlines())
+
+
+def test_rerun_resumes_from_checkpoint(tmp_path):
+    harvest = Harvest(tmp_path)
+    jobs = [job("100", "2023-01-05T10:00:00"), job("200", "2023-02-10T10:00:00")]
+
+    job_ids, calls = harvest.run(jobs)
+    assert job_ids == ["100", "200"]
+    assert calls == 3
+
+    job_ids, calls = harvest.run(jobs)
+    assert job_ids == ["100", "200"]
+    assert calls == 0
+
+
+def test_unfinished_jobs_are_fetched_once_finished(tmp_path):
+    harvest = Harvest(tmp_path)
+    finished = job("100", "2023-01-05T10:00:00")
+    running = job("200", "2023-01-20T10:00:00", end="Unknown")
+
+    job_ids, _ = harvest.run([finished, running], "--incremental")
+    assert job_ids == ["100"]
+
+    running["end"] = "2023-01-20T10:30:00"
+    running["start"] = running["submit"]
+    job_ids, _ = harvest.run([finished, running], "--incremental")
+    assert job_ids == ["100", "200"]
+
+    job_ids, _ = harvest.run([finished, running], "--incremental")
+    assert job_ids == ["100", "200"]
+
+
+def test_single_pass_filters_in_sacct(tmp_path):
+    harvest = Harvest(tmp_path)
+    jobs = [
+        job("100", "2023-01-05T10:00:00"),
+        job("200", "2023-01-06T10:00:00", nodes="1"),
+        job("300", "2023-02-10T10:00:00"),
+    ]
+
+    job_ids, calls = harvest.run(jobs, "--single-pass")
+    assert job_ids == ["100", "300"]
+    assert calls == 2
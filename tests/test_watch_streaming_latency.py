@@ -0,0 +1,69 @@
+import csv
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts/streaming"))
+
+from watch_streaming_latency import LatencyWatcher
+
+CREATED = "2023-01-05T10:00:00"
+
+
+def write_created_times(path, scan_numbers):
+    rows = ["scan_number,time0,time1,time2,time3"]
+    rows += [f"{scan_number},{CREATED},{CREATED},,," for scan_number in scan_numbers]
+    path.write_text("\n".join(rows) + "\n")
+
+
+def write_counted_file(directory, scan_number, seconds_after_created):
+    path = directory / f"FOURD_230105_100000_00123_{scan_number:05}.h5"
+    path.write_bytes(b"counts")
+    mtime = datetime.fromisoformat(CREATED).timestamp() + seconds_after_created
+    os.utime(path, (mtime, mtime))
+
+
+def read_log(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def watcher(tmp_path):
+    counted = tmp_path / "counted"
+    counted.mkdir()
+    created_times = tmp_path / "ncem_file_created_times.csv"
+    write_created_times(created_times, [14])
+    log = tmp_path / "streaming_latency_live.csv"
+    return counted, created_times, log, LatencyWatcher([counted], created_times, log)
+
+
+def test_closed_file_is_logged(tmp_path):
+    counted, _, log, latency_watcher = watcher(tmp_path)
+    try:
+        write_counted_file(counted, 14, 12.5)
+        latency_watcher.run(timeout=0.5)
+    finally:
+        latency_watcher.close()
+
+    (record,) = read_log(log)
+    assert record["distiller_id"] == "00123"
+    assert record["scan_number"] == "14"
+    assert record["time_difference_seconds"] == "12.500"
+
+
+def test_scan_without_receiver_times_waits_for_them(tmp_path):
+    counted, created_times, log, latency_watcher = watcher(tmp_path)
+    try:
+        write_counted_file(counted, 15, 3.0)
+        latency_watcher.run(timeout=0.5)
+        assert read_log(log) == []
+
+        write_created_times(created_times, [14, 15])
+        latency_watcher.run(timeout=0.5)
+    finally:
+        latency_watcher.close()
+
+    (record,) = read_log(log)
+    assert record["scan_number"] == "15"
+    assert record["time_difference_seconds"] == "3.000"